@@ -0,0 +1,183 @@
+"""
+In-process approximate nearest-neighbour search: IVF over k-means centroids
+
+Usage (benchmark against exact search on synthetic vectors):
+    python ann_index.py [--sizes 10000 100000 1000000] [--dim 128] [--nprobe 8]
+"""
+import argparse
+import logging
+import math
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+import config
+from quantization import synthetic_embeddings, synthetic_queries
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_ASSIGN_BLOCK = 16384
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for every vector, computed in blocks"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK):
+        block = np.asarray(vectors[start:start + _ASSIGN_BLOCK], dtype=np.float32)
+        assignments[start:start + _ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """Inverted-file index: vectors are bucketed by nearest centroid, queries scan a few buckets
+
+    Only list membership lives here; vectors stay in the (memory-mapped) embedding
+    matrix, so candidates are always re-scored exactly.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray, nprobe: int = config.ANN_NPROBE):
+        self.centroids = centroids
+        self.assignments = assignments
+        self.nprobe = nprobe
+        self._offsets = None
+        self._ids = None
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, embeddings: np.ndarray, nlist: Optional[int] = config.ANN_NLIST,
+              iterations: int = config.ANN_TRAIN_ITERATIONS, seed: int = 0) -> 'IVFIndex':
+        """Spherical k-means on a sample, then assign every vector to its list"""
+        n = len(embeddings)
+        nlist = nlist or max(1, min(n, int(4 * math.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, max(nlist * 64, 10000))
+        sample = np.asarray(embeddings[np.sort(rng.choice(n, size=sample_size, replace=False))], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = _nearest_centroids(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # Re-seed empty lists from random sample points so no centroid is wasted
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+
+        index = cls(centroids.astype(np.float32), _nearest_centroids(embeddings, centroids))
+        logger.info(f"Trained IVF index: {n} vectors in {nlist} lists")
+        return index
+
+    def add(self, embeddings: np.ndarray):
+        """Insert new vectors (appended after the existing ones) without retraining"""
+        self.assignments = np.concatenate([self.assignments, _nearest_centroids(embeddings, self.centroids)])
+        self._offsets = None
+
+    def _lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """CSR layout of list membership, rebuilt lazily after inserts"""
+        if self._offsets is None:
+            self._ids = np.argsort(self.assignments, kind='stable').astype(np.int64)
+            counts = np.bincount(self.assignments, minlength=self.nlist)
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._offsets, self._ids
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Ids of all vectors in the `nprobe` lists closest to the query"""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        offsets, ids = self._lists()
+        return np.concatenate([ids[offsets[i]:offsets[i + 1]] for i in probe])
+
+    def search(self, embeddings: np.ndarray, query: np.ndarray, k: int,
+               mask: Optional[np.ndarray] = None, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k ids and exact similarities among the probed lists"""
+        candidates = self.candidates(query, nprobe)
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+            if len(candidates) < k:
+                # Partition too sparse in the probed lists: scan the whole partition instead
+                candidates = np.flatnonzero(mask)
+        candidates = np.sort(candidates)
+        scores = np.asarray(embeddings[candidates], dtype=np.float32) @ query
+        order = np.argsort(-scores, kind='stable')[:k]
+        return candidates[order], scores[order]
+
+    def save(self, path: Path):
+        np.savez(path, centroids=self.centroids, assignments=self.assignments, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path: Path) -> 'IVFIndex':
+        data = np.load(path)
+        return cls(data['centroids'], data['assignments'], int(data['nprobe']))
+
+
+def load_or_build(directory: Path, embeddings: np.ndarray) -> Optional[IVFIndex]:
+    """IVF index for the embeddings in `directory`, extended or trained as needed"""
+    if len(embeddings) < config.ANN_MIN_VECTORS:
+        return None
+    path = directory / config.ANN_INDEX_FILE
+    index = IVFIndex.load(path) if path.exists() else None
+
+    if index is not None and len(index.assignments) < len(embeddings):
+        # Embeddings were appended since the index was saved: insert just the new rows
+        index.add(embeddings[len(index.assignments):])
+        index.save(path)
+    elif index is None or len(index.assignments) != len(embeddings):
+        index = IVFIndex.train(embeddings)
+        index.save(path)
+    index.nprobe = config.ANN_NPROBE
+    return index
+
+
+def remove_index(directory: Path):
+    """Delete the saved index so it is retrained for re-exported embeddings"""
+    (directory / config.ANN_INDEX_FILE).unlink(missing_ok=True)
+
+
+def benchmark(sizes: List[int], dim: int = 128, k: int = 10, queries: int = 50,
+              nprobe: int = config.ANN_NPROBE, seed: int = 0) -> List[dict]:
+    """Recall@k and latency of IVF search versus exact search at several corpus sizes"""
+    rows = []
+    for n in sizes:
+        embeddings = synthetic_embeddings(n, dim, clusters=max(1, n // 500), seed=seed)
+        query_vectors = synthetic_queries(embeddings, queries, seed=seed + 1)
+
+        start = time.perf_counter()
+        index = IVFIndex.train(embeddings)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        truth = [set(np.argpartition(-(embeddings @ q), k - 1)[:k].tolist()) for q in query_vectors]
+        exact_ms = (time.perf_counter() - start) * 1000 / queries
+
+        start = time.perf_counter()
+        found = [set(index.search(embeddings, q, k, nprobe=nprobe)[0].tolist()) for q in query_vectors]
+        ivf_ms = (time.perf_counter() - start) * 1000 / queries
+
+        recall = sum(len(t & f) for t, f in zip(truth, found)) / (k * queries)
+        rows.append({
+            'n': n, 'nlist': index.nlist, 'nprobe': nprobe, 'recall': recall,
+            'exact_ms': exact_ms, 'ivf_ms': ivf_ms, 'build_s': build_s
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark IVF search against exact search")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=128, help="vector size (1536 needs ~6 GB at 1M vectors)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--nprobe", type=int, default=config.ANN_NPROBE)
+    args = parser.parse_args()
+
+    print(f"recall@{args.k}, {args.dim}-dim synthetic vectors, {args.queries} queries")
+    print(f"{'vectors':>9} {'nlist':>6} {'nprobe':>6} {'recall':>7} {'exact ms':>9} {'ivf ms':>7} {'speedup':>8} {'build s':>8}")
+    for row in benchmark(args.sizes, args.dim, args.k, args.queries, args.nprobe):
+        print(f"{row['n']:>9} {row['nlist']:>6} {row['nprobe']:>6} {row['recall']:7.3f} "
+              f"{row['exact_ms']:9.2f} {row['ivf_ms']:7.2f} {row['exact_ms'] / row['ivf_ms']:7.1f}x {row['build_s']:8.1f}")
@@ -0,0 +1,131 @@
+"""
+Precomputed answer catalog for the most common questions, served as static JSON
+
+Usage (build after every index rebuild):
+    python answer_catalog.py [--questions questions.json]
+
+The catalog is written to every directory in config.CATALOG_OUTPUT_DIRS, so the
+static frontends and the API handlers can answer these questions without compute.
+"""
+import argparse
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+import config
+from utils import normalize_query
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CATALOG_SCHEMA_VERSION = 1
+
+
+def build_catalog(questions: List[str], pipeline=None) -> Dict:
+    """Answer all questions in one batch and return the catalog document"""
+    if pipeline is None:
+        from rag_pipeline import RAGPipeline
+        pipeline = RAGPipeline()
+
+    # Variants that normalize to the same key are answered once
+    unique: Dict[str, str] = {}
+    for question in questions:
+        unique.setdefault(normalize_query(question), question)
+
+    responses = pipeline.generate_responses(list(unique.values()))
+    index_version = pipeline.vector_store.index_version
+    generated_at = datetime.now(timezone.utc)
+
+    entries = {}
+    for (key, question), response in zip(unique.items(), responses):
+        if response.get('is_error'):
+            logger.warning(f"Skipping '{question}': pipeline error")
+            continue
+        if response.get('is_no_result'):
+            logger.warning(f"Skipping '{question}': nothing found in the index")
+            continue
+        entries[key] = {
+            'question': question,
+            'answer': response['answer'],
+            'source': response['source'],
+            'is_advice': response.get('is_advice', False)
+        }
+
+    return {
+        'schema_version': CATALOG_SCHEMA_VERSION,
+        'version': f"{index_version}-{generated_at.strftime('%Y%m%d%H%M%S')}",
+        'index_version': index_version,
+        'generated_at': generated_at.isoformat(timespec='seconds'),
+        'entries': entries
+    }
+
+
+def write_catalog(catalog: Dict, directories: List[Path] = config.CATALOG_OUTPUT_DIRS) -> List[Path]:
+    """Write the catalog into each output directory (atomically, via rename)"""
+    written = []
+    for directory in directories:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / config.CATALOG_FILE
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(path)
+        written.append(path)
+    logger.info(f"Wrote catalog {catalog['version']} ({len(catalog['entries'])} answers) to "
+                f"{', '.join(str(p) for p in written)}")
+    return written
+
+
+_cache: Dict[Path, tuple] = {}
+
+
+def _read_catalog(path: Optional[Path] = None) -> tuple:
+    """(entries, version) of the catalog file, re-read only when its modification time changes"""
+    path = Path(path or config.CATALOG_OUTPUT_DIRS[0] / config.CATALOG_FILE)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return {}, ''
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        entries, version = catalog.get('entries', {}), catalog.get('version', '')
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read answer catalog {path}: {e}")
+        entries, version = {}, ''
+    _cache[path] = (mtime, entries, version)
+    return entries, version
+
+
+def load_catalog(path: Optional[Path] = None) -> Dict:
+    """Catalog entries keyed by normalized question (empty if no catalog was built)"""
+    return _read_catalog(path)[0]
+
+
+def catalog_version(path: Optional[Path] = None) -> str:
+    """Version of the current catalog ('' if no catalog was built)"""
+    return _read_catalog(path)[1]
+
+
+def lookup_answer(query: str, path: Optional[Path] = None) -> Optional[Dict]:
+    """Precomputed response for a query, or None if it is not in the catalog"""
+    return load_catalog(path).get(normalize_query(query))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the static answer catalog")
+    parser.add_argument("--questions", type=Path,
+                        help="JSON file with a list of questions (default: config.CATALOG_QUESTIONS)")
+    args = parser.parse_args()
+
+    questions = config.CATALOG_QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = json.load(f)
+
+    write_catalog(build_catalog(questions))
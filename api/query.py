@@ -4,17 +4,26 @@ Vercel serverless function for handling RAG queries
 import os
 import json
 import sys
+import time
 from pathlib import Path
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent))
 
+from http_cache import etag_matches, get_header, json_response, not_modified_response, query_etag
+from query_log import log_query
+
 try:
     from rag_pipeline import RAGPipeline
 except ImportError:
     # Handle import errors gracefully
     RAGPipeline = None
 
+try:
+    from answer_catalog import lookup_answer
+except ImportError:
+    lookup_answer = None
+
 # Initialize pipeline (cached across invocations)
 pipeline = None
 
@@ -42,6 +51,7 @@ def handler(request):
         "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
         "Access-Control-Allow-Headers": "Content-Type"
     }
+    request_headers = getattr(request, "headers", None)
     
     # Handle OPTIONS request
     if request.method == "OPTIONS":
@@ -59,43 +69,43 @@ def handler(request):
                 query = ""
         
         if not query:
-            return {
-                "statusCode": 400,
-                "headers": headers,
-                "body": json.dumps({"error": "Query parameter is required"})
-            }
+            return json_response(400, {"error": "Query parameter is required"}, headers, request_headers)
+        
+        # GET answers are cacheable: the ETag only changes with the question or the index
+        etag = query_etag(query) if request.method == "GET" else None
+        if etag and etag_matches(get_header(request_headers, "If-None-Match"), etag):
+            return not_modified_response(query, headers, etag)
+        
+        # Common questions are answered from the precomputed catalog without loading the pipeline
+        lookup_start = time.perf_counter()
+        cached = lookup_answer(query) if lookup_answer else None
+        if cached:
+            log_query(query, "catalog", (time.perf_counter() - lookup_start) * 1000, cached["source"])
+            return json_response(200, {
+                "answer": cached["answer"],
+                "source": cached["source"],
+                "is_advice": cached.get("is_advice", False)
+            }, headers, request_headers, etag)
         
         # Initialize pipeline
         rag_pipeline = init_pipeline()
         if rag_pipeline is None:
-            return {
-                "statusCode": 500,
-                "headers": headers,
-                "body": json.dumps({"error": "Pipeline initialization failed. Please check logs."})
-            }
+            return json_response(500, {"error": "Pipeline initialization failed. Please check logs."}, headers, request_headers)
         
         # Generate response
         response = rag_pipeline.generate_response(query)
         
-        return {
-            "statusCode": 200,
-            "headers": headers,
-            "body": json.dumps({
-                "answer": response["answer"],
-                "source": response["source"],
-                "is_advice": response.get("is_advice", False)
-            })
-        }
+        return json_response(200, {
+            "answer": response["answer"],
+            "source": response["source"],
+            "is_advice": response.get("is_advice", False)
+        }, headers, request_headers, etag, error=response.get("is_error", False))
         
     except Exception as e:
         import traceback
         error_msg = str(e)
         traceback.print_exc()
-        return {
-            "statusCode": 500,
-            "headers": headers,
-            "body": json.dumps({"error": error_msg})
-        }
+        return json_response(500, {"error": error_msg}, headers, request_headers)
 
 # Vercel serverless function entry point
 # Vercel automatically calls the handler function
@@ -59,15 +59,35 @@ SOURCE_URLS = {
 # RAG Configuration
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+CHUNK_WORKERS = int(os.environ.get("MF_CHUNK_WORKERS", "0"))  # process pool for splitting pages; 0 = serial
+CHUNK_PARALLEL_MIN_CHARS = 20000  # pages shorter than this are split in-process (pickling costs more)
 EMBEDDING_MODEL = "text-embedding-3-small"
 LLM_MODEL = "gpt-4-turbo-preview"
 TEMPERATURE = 0.1
 MAX_TOKENS = 300
+CONTEXT_CHARS = 500  # characters of each retrieved chunk placed in the prompt
 
 # Vector Store Configuration
 COLLECTION_NAME = "mutual_fund_facts"
 TOP_K_RESULTS = 3
 
+# Sharding: one collection per AMC / source family (keys of SOURCE_URLS per shard).
+# Each shard lives in VECTOR_STORE_DIR / "shards" / <name> as "<COLLECTION_NAME>_<name>".
+ENABLE_SHARDING = False
+SHARDS = {
+    "nippon": [
+        "nippon_main", "large_cap", "flexi_cap", "elss", "small_cap", "by_asset_class",
+        "kim", "sid", "addenda", "nav_dividends", "risk_analyzer"
+    ],
+    "regulators": [
+        "amfi_investor", "amfi_elss_faq", "amfi_riskometer", "amfi_kyc",
+        "sebi_education", "sebi_home"
+    ],
+    "registrars": ["cams_statements", "kfintech_statements"],
+}
+SHARD_SEARCH_WORKERS = 4  # shards searched concurrently per query
+INDEX_VERSION_FILE = "index_version.json"  # content hash written on every build
+
 # UI Configuration
 APP_TITLE = "Mutual Fund Facts Assistant"
 APP_SUBTITLE = "Get factual answers about mutual fund schemes"
@@ -77,15 +97,205 @@ EXAMPLE_QUESTIONS = [
     "How to download capital gains statement?"
 ]
 
-# Advice detection keywords
+# Precomputed answer catalog (python answer_catalog.py), served statically by the frontends
+CATALOG_FILE = "answer_catalog.json"
+CATALOG_OUTPUT_DIRS = [PROJECT_ROOT / "public", PROJECT_ROOT / "docs"]
+CATALOG_QUESTIONS = EXAMPLE_QUESTIONS + [
+    "What is the exit load for small cap funds?",
+    "What is the lock-in period for ELSS?",
+    "What is the expense ratio of Nippon India Flexi Cap Fund?",
+    "What is the expense ratio of Nippon India Small Cap Fund?",
+    "What is the benchmark of Nippon India Large Cap Fund?",
+    "What is the riskometer level of Nippon India Small Cap Fund?",
+    "How to download consolidated account statement?",
+    "How do I complete KYC for mutual funds?",
+]
+
+# Advice detection keywords (matched from the start of a word: "recommend" also catches "recommendation")
 ADVICE_KEYWORDS = [
     "should i", "should i buy", "should i sell", "is it good", "is it bad",
     "recommend", "best", "worst", "compare returns", "which is better",
     "advice", "suggest", "opinion", "think", "believe"
 ]
 
+# Query routing: phrase -> scheme name (matched case-insensitively on word boundaries)
+SCHEME_KEYWORDS = {
+    "nippon india large cap fund": "Nippon India Large Cap Fund",
+    "large cap": "Nippon India Large Cap Fund",
+    "largecap": "Nippon India Large Cap Fund",
+    "nippon india flexi cap fund": "Nippon India Flexi Cap Fund",
+    "flexi cap": "Nippon India Flexi Cap Fund",
+    "flexicap": "Nippon India Flexi Cap Fund",
+    "nippon india elss tax saver fund": "Nippon India ELSS Tax Saver Fund",
+    "elss": "Nippon India ELSS Tax Saver Fund",
+    "tax saver": "Nippon India ELSS Tax Saver Fund",
+    "nippon india small cap fund": "Nippon India Small Cap Fund",
+    "small cap": "Nippon India Small Cap Fund",
+    "smallcap": "Nippon India Small Cap Fund",
+}
+
+# Query routing: phrase -> document type a question explicitly asks for
+DOC_TYPE_KEYWORDS = {
+    "kim": "kim",
+    "key information memorandum": "kim",
+    "sid": "sid",
+    "scheme information document": "sid",
+    "addenda": "addenda",
+    "addendum": "addenda",
+    "statement": "statements",
+    "statements": "statements",
+    "cas": "statements",
+    "consolidated account statement": "statements",
+}
+
+# Query routing: phrase -> requested attribute
+ATTRIBUTE_KEYWORDS = {
+    "expense ratio": "expense_ratio",
+    "ter": "expense_ratio",
+    "exit load": "exit_load",
+    "minimum sip": "minimum_sip",
+    "min sip": "minimum_sip",
+    "sip amount": "minimum_sip",
+    "lock-in": "lock_in",
+    "lock in": "lock_in",
+    "riskometer": "riskometer",
+    "risk-o-meter": "riskometer",
+    "benchmark": "benchmark",
+    "nav": "nav",
+    "capital gains": "capital_gains_statement",
+    "kyc": "kyc",
+}
+
+# Ingest-time partition tags per source (keys of SOURCE_URLS)
+SOURCE_SCHEMES = {
+    "large_cap": "Nippon India Large Cap Fund",
+    "flexi_cap": "Nippon India Flexi Cap Fund",
+    "elss": "Nippon India ELSS Tax Saver Fund",
+    "small_cap": "Nippon India Small Cap Fund",
+}
+SOURCE_DOC_TYPES = {
+    "large_cap": "scheme_page",
+    "flexi_cap": "scheme_page",
+    "elss": "scheme_page",
+    "small_cap": "scheme_page",
+    "kim": "kim",
+    "sid": "sid",
+    "addenda": "addenda",
+    "nav_dividends": "nav",
+    "cams_statements": "statements",
+    "kfintech_statements": "statements",
+}
+DEFAULT_DOC_TYPE = "general"
+
 # Response templates
 ADVICE_REFUSAL_MESSAGE = """I can only provide factual information from official sources. For investment advice, please consult a registered investment advisor or financial planner.
 
 You can learn more about mutual funds at: https://www.amfiindia.com/investor-corner/knowledge-center/faqs"""
 
+
+# Deduplication Configuration
+DEDUP_ENABLED = True
+DEDUP_SHINGLE_SIZE = 5  # words per shingle for near-duplicate detection
+DEDUP_NUM_PERM = 64  # MinHash signature length
+DEDUP_LSH_BANDS = 16  # must divide DEDUP_NUM_PERM
+DEDUP_SIMILARITY_THRESHOLD = 0.8  # estimated Jaccard above which chunks are duplicates
+DEDUP_MIN_CHUNK_CHARS = 50  # drop chunks shorter than this after boilerplate removal
+BOILERPLATE_SHINGLE_SIZE = 8  # words per shingle for boilerplate span detection
+BOILERPLATE_MIN_SOURCES = 3  # a span repeated on this many sources is boilerplate
+
+# Lexical (BM25) Index Configuration
+LEXICAL_INDEX_FILE = "bm25_index.json"  # stored next to the Chroma files
+BM25_K1 = 1.5
+BM25_B = 0.75
+LEXICAL_MIN_SCORE = 0.5  # normalized BM25 score the top hit must reach (1.0 = every term matched)
+LEXICAL_DECISIVE_RATIO = 1.5  # ...and beat the runner-up by this factor to skip vector search
+RRF_K = 60  # reciprocal rank fusion constant for hybrid ranking
+ROUTE_MIN_SIMILARITY = 0.35  # a routed partition's best vector match must reach this, or the search widens
+
+# Shared (memory-mapped) embedding index, exported next to the Chroma files
+SHARED_EMBEDDINGS_FILE = "embeddings.npy"
+SHARED_DOCUMENTS_FILE = "embedding_docs.json"
+SHARED_APPEND_BLOCK_ROWS = 65536  # rows copied at a time when appending, so memory does not grow with the index
+
+# Server mode Configuration (long-running ASGI server, see server.py)
+SERVER_HOST = os.environ.get("MF_SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("PORT", "8000"))
+SERVER_WORKERS = int(os.environ.get("MF_SERVER_WORKERS", "2"))
+SERVER_GRACEFUL_TIMEOUT = 30  # seconds to let in-flight requests finish on shutdown
+SERVER_KEEPALIVE_TIMEOUT = 5  # seconds an idle client connection is kept open
+SERVER_MAX_CONCURRENCY = 8  # pipeline calls in flight per worker
+LLM_POOL_MAX_CONNECTIONS = 20
+LLM_POOL_MAX_KEEPALIVE = 10
+LLM_POOL_KEEPALIVE_EXPIRY = 60.0  # seconds
+
+# Quantized embedding storage (None keeps full float32 search)
+EMBEDDING_QUANTIZATION = None  # None, "int8" (4x smaller) or "binary" (32x smaller)
+QUANTIZED_RERANK_CANDIDATES = 100  # shortlist re-ranked with full-precision vectors
+QUANTIZED_SCAN_BLOCK = 256  # rows decoded per block; small blocks stay cache-resident
+
+# Approximate nearest-neighbour index over the shared embeddings
+ANN_INDEX = None  # None (exact search) or "ivf"
+ANN_INDEX_FILE = "ivf_index.npz"
+ANN_NLIST = None  # number of k-means lists; None picks ~4 * sqrt(n)
+ANN_NPROBE = 8  # lists scanned per query: higher = better recall, slower
+ANN_MIN_VECTORS = 2000  # below this exact search is already fast enough
+ANN_TRAIN_ITERATIONS = 10
+
+# HTTP caching for GET queries (ETag = normalized query + index version)
+CACHE_CONTROL_ANSWER = "public, max-age=3600, s-maxage=86400, stale-while-revalidate=604800"
+CACHE_CONTROL_ADVICE = "public, max-age=86400, s-maxage=604800, stale-while-revalidate=604800"  # refusal text never depends on the index
+CACHE_CONTROL_ERROR = "no-store"  # never let a CDN pin a transient failure
+COMPRESSION_MIN_BYTES = 512  # smaller bodies are sent uncompressed
+
+# Adaptive refresh scheduler (python refresh_scheduler.py --once | --daemon)
+REFRESH_STATE_FILE = DATA_DIR / "refresh_state.json"
+REFRESH_DEFAULT_INTERVAL = 24 * 3600  # seconds between checks for a source with no history
+REFRESH_INITIAL_INTERVALS = {  # seeds for sources whose change rate is known up front
+    "nav_dividends": 6 * 3600,
+    "addenda": 12 * 3600,
+    "sebi_education": 7 * 24 * 3600,
+    "sebi_home": 7 * 24 * 3600
+}
+REFRESH_MIN_INTERVAL = 3 * 3600  # never poll a source more often than this
+REFRESH_MAX_INTERVAL = 30 * 24 * 3600  # nor less often than this
+REFRESH_BACKOFF = 2.0  # interval multiplier after a check that found no change
+REFRESH_SPEEDUP = 0.5  # interval multiplier after a check that found a change
+REFRESH_RETRY_DELAY = 1800  # first retry after a failed fetch (doubles per failure, capped at the interval)
+REFRESH_HISTORY_LENGTH = 20  # change timestamps kept per source
+REFRESH_WORKERS = 4  # hosts fetched in parallel (sources on one host are fetched one at a time)
+REFRESH_POLITENESS_DELAY = 2  # seconds between requests to the same host
+REFRESH_DAEMON_MAX_SLEEP = 900  # daemon wakes at least this often to re-read the state
+
+# Query log (opt-in): one JSON line per query, written by a background thread
+QUERY_LOG_ENABLED = os.environ.get("MF_QUERY_LOG", "0") == "1"
+QUERY_LOG_DIR = DATA_DIR / "query_log"  # one file per process: queries-<pid>.jsonl
+QUERY_LOG_BATCH_SIZE = 100  # entries written per flush
+QUERY_LOG_FLUSH_INTERVAL = 2.0  # seconds a partial batch may wait
+QUERY_LOG_QUEUE_SIZE = 10000  # entries beyond this are dropped rather than blocking a request
+QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024  # rotate a file past this size
+QUERY_LOG_BACKUPS = 5  # rotated files kept per process
+HOT_QUERY_COUNT = 50  # most frequent queries warmed by `python query_log.py warm`
+
+# Query embedding cache (normalized query -> embedding), filled on demand and by warming
+QUERY_EMBEDDING_CACHE_FILE = "query_embeddings.npz"  # kept in VECTOR_STORE_DIR
+QUERY_EMBEDDING_CACHE_SIZE = 2000  # entries kept in memory (and on disk)
+QUERY_EMBEDDING_CACHE_RELOAD_INTERVAL = 30  # seconds between checks for a cache file rewritten by warming
+WARM_AFTER_REFRESH = False  # re-warm caches from the query log after refresh_scheduler re-indexes
+
+# Retrieval evaluation (python evaluate.py): golden set and default parameter sweep
+GOLDEN_SET_FILE = PROJECT_ROOT / "golden_set.json"
+EVAL_CACHE_DIR = DATA_DIR / "eval_cache"  # cached document/query embeddings and recorded LLM answers
+EVAL_CHUNK_SIZES = [500, 1000, 1500]
+EVAL_CHUNK_OVERLAPS = [100, 200]
+EVAL_TOP_K = [3, 5]
+EVAL_CONTEXT_CHARS = [300, 500, 1000]
+
+# Linked PDF documents (python pdf_collector.py): downloaded by streaming, extracted page by page
+PDF_SOURCE_KEYS = ["kim", "sid", "addenda"]  # SOURCE_URLS whose linked PDFs are indexed
+PDF_DIR = DATA_DIR / "pdfs"
+PDF_MANIFEST_FILE = PDF_DIR / "manifest.json"  # per-PDF sha256, HTTP validators and index state
+PDF_MAX_PER_SOURCE = 50  # linked PDFs followed per source page
+PDF_MAX_BYTES = 200 * 1024 * 1024  # downloads larger than this are abandoned
+PDF_DOWNLOAD_CHUNK_BYTES = 1024 * 1024  # streamed to disk per read
+PDF_PAGES_PER_BATCH = 20  # pages chunked and added to the index together
+MAX_PENDING_CHUNKS = 2000  # deferred chunks held before the lexical index / exported vectors are updated anyway
@@ -33,6 +33,9 @@ class DataCollector:
             
             soup = BeautifulSoup(response.content, 'lxml')
             
+            # Linked PDFs (KIM / SID / addenda) are collected separately, see pdf_collector.py
+            pdf_links = self.extract_pdf_links(soup, response.url)
+            
             # Remove script and style elements
             for script in soup(["script", "style", "nav", "footer", "header"]):
                 script.decompose()
@@ -58,6 +61,7 @@ class DataCollector:
                 'title': title_text,
                 'description': description,
                 'content': text,
+                'pdf_links': pdf_links,
                 'timestamp': time.time()
             }
             
@@ -68,6 +72,28 @@ class DataCollector:
             logger.error(f"Unexpected error processing {url}: {e}")
             return None
     
+    @staticmethod
+    def extract_pdf_links(soup: BeautifulSoup, base_url: str) -> List[Dict]:
+        """Absolute URLs and link texts of the PDFs a page links to (first occurrence of each)"""
+        links = {}
+        for anchor in soup.find_all('a', href=True):
+            url = urljoin(base_url, anchor['href'].strip())
+            if urlparse(url).path.lower().endswith('.pdf') and url not in links:
+                links[url] = anchor.get_text(' ', strip=True)
+        return [{'url': url, 'text': text} for url, text in links.items()]
+    
+    def save_source(self, source_name: str, data: Dict):
+        """Save one source's scraped page"""
+        output_file = self.scraped_data_dir / f"{source_name}.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    def save_combined(self, all_data: List[Dict]):
+        """Save the combined file that the vector store is built from"""
+        combined_file = self.scraped_data_dir / "all_sources.json"
+        with open(combined_file, 'w', encoding='utf-8') as f:
+            json.dump(all_data, f, ensure_ascii=False, indent=2)
+    
     def collect_all_sources(self) -> List[Dict]:
         """Collect data from all configured sources"""
         all_data = []
@@ -76,9 +102,7 @@ class DataCollector:
             data = self.fetch_page(url)
             if data:
                 # Save individual file
-                output_file = self.scraped_data_dir / f"{source_name}.json"
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                self.save_source(source_name, data)
                 
                 all_data.append(data)
                 logger.info(f"Successfully collected: {source_name}")
@@ -87,9 +111,7 @@ class DataCollector:
             time.sleep(2)
         
         # Save combined data
-        combined_file = self.scraped_data_dir / "all_sources.json"
-        with open(combined_file, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=2)
+        self.save_combined(all_data)
         
         logger.info(f"Collected {len(all_data)} sources")
         return all_data
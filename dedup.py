@@ -0,0 +1,263 @@
+"""
+Boilerplate and near-duplicate chunk elimination between chunking and embedding
+"""
+import hashlib
+import logging
+import random
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+from langchain.schema import Document
+import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_PATTERN = re.compile(r'\S+')
+_NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)*')
+# Chunks tagged differently belong to different partitions and are never merged
+_PARTITION_FIELDS = ('scheme', 'doc_type', 'source_key')
+
+
+def _hash_shingle(shingle: str) -> int:
+    """Stable 64-bit hash of a shingle (independent of PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _word_shingles(words: List[str], size: int) -> List[int]:
+    """Hash every run of `size` consecutive words"""
+    if len(words) < size:
+        return [_hash_shingle(' '.join(words))] if words else []
+    return [_hash_shingle(' '.join(words[i:i + size])) for i in range(len(words) - size + 1)]
+
+
+def _sources_of(doc: Document) -> List[str]:
+    """All sources a chunk's text stands for (its own plus collapsed near-duplicates)"""
+    merged = doc.metadata.get('sources', '')
+    if merged:
+        return merged.split()
+    source = doc.metadata.get('source', '')
+    return [source] if source else []
+
+
+def _merge_key(doc: Document) -> Tuple:
+    """Chunks may only be collapsed into each other when this is equal
+
+    Template pages of different schemes are near-identical except for their figures
+    (expense ratio, exit load, ...), and those figures are the facts being asked about.
+    """
+    return (tuple(_NUMBER_PATTERN.findall(doc.page_content)),
+            tuple(doc.metadata.get(field, '') for field in _PARTITION_FIELDS))
+
+
+class ChunkDeduplicator:
+    """Strips cross-source boilerplate and collapses near-duplicate chunks"""
+
+    def __init__(self,
+                 shingle_size: int = config.DEDUP_SHINGLE_SIZE,
+                 num_perm: int = config.DEDUP_NUM_PERM,
+                 bands: int = config.DEDUP_LSH_BANDS,
+                 threshold: float = config.DEDUP_SIMILARITY_THRESHOLD,
+                 boilerplate_shingle_size: int = config.BOILERPLATE_SHINGLE_SIZE,
+                 boilerplate_min_sources: int = config.BOILERPLATE_MIN_SOURCES,
+                 min_chunk_chars: int = config.DEDUP_MIN_CHUNK_CHARS):
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.boilerplate_shingle_size = boilerplate_shingle_size
+        self.boilerplate_min_sources = boilerplate_min_sources
+        self.min_chunk_chars = min_chunk_chars
+
+        # Fixed seed so the same corpus always dedups to the same index
+        rng = random.Random(1)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def minhash(self, text: str) -> List[int]:
+        """MinHash signature of the text's word shingles"""
+        shingles = set(_word_shingles(text.lower().split(), self.shingle_size))
+        if not shingles:
+            return [_MERSENNE_PRIME] * self.num_perm
+        values = [s % _MERSENNE_PRIME for s in shingles]
+        return [min((a * v + b) % _MERSENNE_PRIME for v in values) for a, b in self._perms]
+
+    def strip_boilerplate(self, documents: List[Document]) -> Tuple[List[Document], int]:
+        """Remove spans repeated across many sources from all but their first source"""
+        k = self.boilerplate_shingle_size
+
+        # Tokenize once, keeping character spans so original whitespace survives
+        tokenized = []
+        for doc in documents:
+            matches = list(_WORD_PATTERN.finditer(doc.page_content))
+            words = [m.group().lower() for m in matches]
+            tokenized.append((matches, _word_shingles(words, k) if len(words) >= k else []))
+
+        # Which sources carry each shingle, and which one saw it first (the canonical owner)
+        shingle_sources: Dict[int, set] = defaultdict(set)
+        shingle_owner: Dict[int, str] = {}
+        for doc, (_, shingles) in zip(documents, tokenized):
+            source = doc.metadata.get('source', '')
+            for shingle in shingles:
+                shingle_sources[shingle].add(source)
+                shingle_owner.setdefault(shingle, source)
+
+        boilerplate = {
+            shingle for shingle, sources in shingle_sources.items()
+            if len(sources) >= self.boilerplate_min_sources
+        }
+        if not boilerplate:
+            return documents, 0
+
+        cleaned = []
+        removed_chars = 0
+        for doc, (matches, shingles) in zip(documents, tokenized):
+            source = doc.metadata.get('source', '')
+            covered = [False] * len(matches)
+            shared_with = set()
+            for i, shingle in enumerate(shingles):
+                if shingle not in boilerplate:
+                    continue
+                if shingle_owner[shingle] == source:
+                    shared_with.update(shingle_sources[shingle])
+                    continue
+                for j in range(i, i + k):
+                    covered[j] = True
+
+            metadata = dict(doc.metadata)
+            shared_with.discard(source)
+            if shared_with:
+                # Only the shared span is on these pages, so they are recorded apart from `sources`
+                metadata['boilerplate_sources'] = ' '.join(sorted(s for s in shared_with if s))
+
+            if not any(covered):
+                cleaned.append(Document(page_content=doc.page_content, metadata=metadata))
+                continue
+
+            # Cut covered words out, keeping the original text between them intact
+            text = doc.page_content
+            pieces = []
+            cursor = 0
+            for match, is_covered in zip(matches, covered):
+                if is_covered:
+                    pieces.append(text[cursor:match.start()])
+                    cursor = match.end()
+            pieces.append(text[cursor:])
+            new_text = ' '.join(piece.strip() for piece in pieces if piece.strip())
+            removed_chars += len(text) - len(new_text)
+
+            if len(new_text) >= self.min_chunk_chars:
+                # The stripped text is no longer one contiguous span of the page
+                metadata.pop('start_index', None)
+                metadata.pop('end_index', None)
+                cleaned.append(Document(page_content=new_text, metadata=metadata))
+
+        return cleaned, removed_chars
+
+    def collapse_near_duplicates(self, documents: List[Document]) -> Tuple[List[Document], int]:
+        """Keep the first of each group of near-duplicate chunks, tracking every source
+
+        Only chunks with the same numbers and the same scheme / doc_type / source_key tags are merged.
+        """
+        signatures = [self.minhash(doc.page_content) for doc in documents]
+        merge_keys = [_merge_key(doc) for doc in documents]
+
+        # LSH: chunks sharing any identical band are candidate pairs
+        buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = defaultdict(list)
+        for idx, signature in enumerate(signatures):
+            for band in range(self.bands):
+                key = tuple(signature[band * self.rows:(band + 1) * self.rows])
+                buckets[(band, key)].append(idx)
+
+        canonical = list(range(len(documents)))
+
+        def find(i: int) -> int:
+            while canonical[i] != i:
+                canonical[i] = canonical[canonical[i]]
+                i = canonical[i]
+            return i
+
+        checked = set()
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            for pos, i in enumerate(members):
+                for j in members[pos + 1:]:
+                    if (i, j) in checked:
+                        continue
+                    checked.add((i, j))
+                    if merge_keys[i] != merge_keys[j]:
+                        continue
+                    agreement = sum(a == b for a, b in zip(signatures[i], signatures[j]))
+                    if agreement / self.num_perm >= self.threshold:
+                        root_i, root_j = find(i), find(j)
+                        if root_i != root_j:
+                            # Earliest chunk stays canonical so output order is stable
+                            canonical[max(root_i, root_j)] = min(root_i, root_j)
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for idx in range(len(documents)):
+            groups[find(idx)].append(idx)
+
+        kept = []
+        for root in sorted(groups):
+            members = groups[root]
+            doc = documents[root]
+            metadata = dict(doc.metadata)
+            if len(members) > 1:
+                sources = set()
+                for member in members:
+                    sources.update(_sources_of(documents[member]))
+                metadata['sources'] = ' '.join(sorted(s for s in sources if s))
+                metadata['duplicate_count'] = len(members) - 1
+            kept.append(Document(page_content=doc.page_content, metadata=metadata))
+
+        return kept, len(documents) - len(kept)
+
+    @staticmethod
+    def renumber(documents: List[Document]):
+        """Make chunk_index / total_chunks consecutive per source again after chunks were dropped"""
+        totals = Counter(doc.metadata.get('source', '') for doc in documents)
+        positions: Dict[str, int] = defaultdict(int)
+        for doc in documents:
+            if 'chunk_index' not in doc.metadata:
+                continue
+            source = doc.metadata.get('source', '')
+            doc.metadata['chunk_index'] = positions[source]
+            doc.metadata['total_chunks'] = totals[source]
+            positions[source] += 1
+
+    def deduplicate(self, documents: List[Document]) -> Tuple[List[Document], Dict]:
+        """Run boilerplate stripping then near-duplicate collapsing; return docs and stats"""
+        input_chunks = len(documents)
+        input_chars = sum(len(doc.page_content) for doc in documents)
+
+        stripped, boilerplate_chars = self.strip_boilerplate(documents)
+        boilerplate_dropped = len(documents) - len(stripped)
+        deduped, duplicates_removed = self.collapse_near_duplicates(stripped)
+        self.renumber(deduped)
+
+        output_chars = sum(len(doc.page_content) for doc in deduped)
+        stats = {
+            'input_chunks': input_chunks,
+            'output_chunks': len(deduped),
+            'boilerplate_chars_removed': boilerplate_chars,
+            'boilerplate_chunks_dropped': boilerplate_dropped,
+            'near_duplicates_removed': duplicates_removed,
+            'input_chars': input_chars,
+            'output_chars': output_chars,
+            'chunk_reduction_pct': round(100 * (1 - len(deduped) / input_chunks), 1) if input_chunks else 0.0,
+            'char_reduction_pct': round(100 * (1 - output_chars / input_chars), 1) if input_chars else 0.0,
+        }
+        logger.info(
+            f"Dedup: {input_chunks} -> {len(deduped)} chunks "
+            f"({stats['chunk_reduction_pct']}% fewer, {stats['char_reduction_pct']}% fewer chars; "
+            f"{duplicates_removed} near-duplicates, {boilerplate_chars} boilerplate chars removed)"
+        )
+        return deduped, stats
@@ -0,0 +1,129 @@
+"""
+Query embedding cache: normalized query -> embedding, persisted next to the vector store
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+import config
+from utils import normalize_query
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bumped when what the stored vectors embed changes (2: the normalized query, not the raw one)
+CACHE_FORMAT = 2
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU map from normalized query to its embedding (for one embedding model)"""
+
+    def __init__(self, path: Path, model: str = config.EMBEDDING_MODEL,
+                 max_size: int = config.QUERY_EMBEDDING_CACHE_SIZE):
+        self.path = Path(path)
+        self.model = model
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked = time.monotonic()
+        self._load()
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _load(self):
+        """Merge the entries on disk into memory (entries already in memory win)"""
+        mtime = self._file_mtime()
+        if mtime is None:
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data['model']) != self.model:
+                    logger.info(f"Ignoring query embedding cache built for {data['model']}")
+                    return
+                if 'format' not in data or int(data['format']) != CACHE_FORMAT:
+                    logger.info("Ignoring query embedding cache written in an older format")
+                    return
+                loaded = list(zip(data['keys'].tolist(), data['vectors']))
+        except Exception as e:
+            logger.warning(f"Could not read query embedding cache: {e}")
+            return
+        with self._lock:
+            for key, vector in loaded:
+                if key not in self._entries:
+                    self._entries[key] = vector
+                    # File entries are older than anything used in this process
+                    self._entries.move_to_end(key, last=False)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._mtime = mtime
+
+    def refresh(self, interval: float = config.QUERY_EMBEDDING_CACHE_RELOAD_INTERVAL):
+        """Pick up a cache file rewritten by another process (e.g. warming after a refresh)
+
+        Checks the file's mtime at most once per interval, so the hot path stays a stat call at worst.
+        """
+        now = time.monotonic()
+        if now - self._checked < interval:
+            return
+        self._checked = now
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime:
+            self._load()
+            logger.info(f"Reloaded query embedding cache ({len(self._entries)} entries)")
+
+    def get(self, query: str) -> Optional[List[float]]:
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                return None
+            self._entries.move_to_end(key)
+        return vector.tolist()
+
+    def put(self, query: str, vector: List[float]):
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, query: str) -> bool:
+        return normalize_query(query) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def save(self):
+        """Persist the cache (atomically, via rename)"""
+        with self._lock:
+            keys = list(self._entries)
+            vectors = np.stack(list(self._entries.values())) if keys else np.empty((0, 0), dtype=np.float32)
+        tmp_path = self.path.with_name(self.path.stem + '.tmp.npz')
+        np.savez(tmp_path, keys=np.asarray(keys, dtype=str), vectors=vectors, model=self.model,
+                 format=CACHE_FORMAT)
+        tmp_path.replace(self.path)
+        # Our own write is already in memory; refresh() should not reload it
+        self._mtime = self._file_mtime()
+        logger.info(f"Saved {len(keys)} query embeddings to {self.path}")
+
+
+_cache: Optional[QueryEmbeddingCache] = None
+
+
+def get_embedding_cache() -> QueryEmbeddingCache:
+    """Process-wide cache, loaded on first use and reloaded when the file on disk changes"""
+    global _cache
+    if _cache is None:
+        _cache = QueryEmbeddingCache(config.VECTOR_STORE_DIR / config.QUERY_EMBEDDING_CACHE_FILE)
+    else:
+        _cache.refresh()
+    return _cache
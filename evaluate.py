@@ -0,0 +1,352 @@
+"""
+Offline retrieval evaluation: quality versus latency and prompt size over a parameter sweep
+
+Usage:
+    python evaluate.py [--chunk-sizes 500 1000] [--overlaps 100 200] [--top-k 3 5]
+                       [--context-chars 300 500] [--embeddings cached|hashing]
+                       [--llm none|fake|recorded] [--record] [--output results.json]
+
+Every configuration is built in memory from the scraped data (no Chroma, nothing
+written to vector_store/). Document and query embeddings are cached under
+config.EVAL_CACHE_DIR, so only the first run of a chunking setup calls the API.
+`--embeddings hashing` runs fully offline.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+import statistics
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import config
+from data_collector import DataCollector
+from lexical_index import BM25Index, tokenize
+from query_router import get_router, routed_search
+from rag_pipeline import RAGPipeline
+from shared_index import SharedEmbeddingIndex
+from utils import normalize_query
+from vector_store import VectorStore, documents_to_sources
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class HashingEmbeddings:
+    """Deterministic offline stand-in for the embedding API: hashed unigrams and bigrams"""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        tokens = tokenize(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], 'little') % self.dim] += 1 if digest[4] & 1 else -1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class CachedEmbeddings:
+    """Embedding client wrapper that keeps every vector on disk, so sweeps never re-embed a text"""
+
+    def __init__(self, client, path: Path):
+        self.client = client
+        self.path = Path(path)
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        if self.path.exists():
+            data = np.load(self.path)
+            self._vectors = dict(zip(data['keys'].tolist(), data['vectors']))
+
+    @staticmethod
+    def _key(kind: str, text: str) -> str:
+        return hashlib.sha256(f"{kind}\n{text}".encode('utf-8')).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key('doc', text) for text in texts]
+        missing = list({key: text for key, text in zip(keys, texts) if key not in self._vectors}.items())
+        if missing:
+            logger.info(f"Embedding {len(missing)} uncached chunks")
+            vectors = self.client.embed_documents([text for _, text in missing])
+            for (key, _), vector in zip(missing, vectors):
+                self._vectors[key] = np.asarray(vector, dtype=np.float32)
+            self._dirty = True
+        return [self._vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key('query', text)
+        if key not in self._vectors:
+            self._vectors[key] = np.asarray(self.client.embed_query(text), dtype=np.float32)
+            self._dirty = True
+        return self._vectors[key].tolist()
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.stem + '.tmp.npz')
+        np.savez(tmp_path, keys=np.asarray(list(self._vectors), dtype=str),
+                 vectors=np.stack(list(self._vectors.values())))
+        tmp_path.replace(self.path)
+        self._dirty = False
+
+
+class FakeLLM:
+    """Extractive stand-in for the LLM: answers with the context sentence closest to the question"""
+
+    def invoke(self, messages) -> SimpleNamespace:
+        prompt = messages[-1].content
+        context, _, question = prompt.partition("\n\nQuestion: ")
+        question_terms = set(tokenize(question.split("\n")[0]))
+        sentences = [s.strip() for s in context.replace("\n", " ").split(". ") if s.strip()]
+        best = max(sentences, key=lambda s: len(question_terms & set(tokenize(s))), default="")
+        return SimpleNamespace(content=best)
+
+
+class RecordedLLM:
+    """Replays answers recorded from the real LLM, keyed by the exact prompt
+
+    With `live` set, prompts that were never recorded are sent to it and recorded.
+    """
+
+    def __init__(self, path: Path, live=None):
+        self.path = Path(path)
+        self.live = live
+        self.responses: Dict[str, str] = {}
+        self.missing = 0
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.responses = json.load(f)
+
+    def invoke(self, messages) -> SimpleNamespace:
+        key = hashlib.sha256("\n\n".join(m.content for m in messages).encode('utf-8')).hexdigest()
+        if key not in self.responses:
+            if self.live is None:
+                self.missing += 1
+                return SimpleNamespace(content="")
+            self.responses[key] = self.live.invoke(messages).content
+        return SimpleNamespace(content=self.responses[key])
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.responses, f, ensure_ascii=False, indent=2)
+
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Prompt tokens (tiktoken when available, else ~4 characters per token)"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return len(_encoding.encode(text)) if _encoding else max(1, len(text) // 4)
+
+
+class OfflineVectorStore(VectorStore):
+    """The production search path (BM25 fast path, exact vector search, RRF) over in-memory chunks"""
+
+    def __init__(self, data: List[Dict], embeddings, chunk_size: int, chunk_overlap: int):
+        # VectorStore.__init__ is skipped on purpose: no Chroma client, nothing persisted
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+        self.dedup_stats = None
+        self.documents = self.create_documents_from_data(data)
+        self.vector_store = self.documents  # in memory: nothing to load
+
+        self.lexical_index = BM25Index()
+        self.lexical_index.build(self.documents)
+
+        matrix = np.asarray(embeddings.embed_documents([doc.page_content for doc in self.documents]),
+                            dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.shared_index = SharedEmbeddingIndex(matrix / np.where(norms == 0, 1, norms), self.documents)
+
+    def embed_query(self, query: str) -> List[float]:
+        # Same text as VectorStore.embed_query embeds
+        return self.embeddings.embed_query(normalize_query(query))
+
+    def size(self) -> Dict:
+        return {
+            'chunks': len(self.documents),
+            'text_mb': sum(len(doc.page_content) for doc in self.documents) / 1e6,
+            'vectors_mb': self.shared_index.embeddings.nbytes / 1e6
+        }
+
+
+def retrieve(store: VectorStore, query: str, k: int) -> List[Dict]:
+    """Search the way RAGPipeline does: narrowest routed partition first, then wider"""
+    return documents_to_sources(routed_search(store, query, get_router().route(query), k=k))
+
+
+def leaked_facts(golden: List[Dict]) -> List[str]:
+    """Key facts that appear in their own question (they would score without being retrieved)"""
+    return [
+        f"{item['question']!r}: {fact!r}"
+        for item in golden
+        for fact in item.get('key_facts', [])
+        if _contains_fact(item['question'], fact)
+    ]
+
+
+def _contains_fact(text: str, fact: str) -> bool:
+    # Whole words only, so a short fact such as "SID" or "TER" is not found inside "inside" or "after"
+    return re.search(r'(?<!\w)' + re.escape(fact) + r'(?!\w)', text, re.IGNORECASE) is not None
+
+
+def _fact_recall(facts: List[str], text: str) -> float:
+    if not facts:
+        return 1.0
+    return sum(_contains_fact(text, fact) for fact in facts) / len(facts)
+
+
+def evaluate(store: VectorStore, golden: List[Dict], k: int, context_chars: int, llm=None) -> Dict:
+    """recall@k, MRR, latency and prompt size of one configuration over the golden set"""
+    recalls, reciprocal_ranks, latencies, prompt_tokens, context_facts, answer_facts = [], [], [], [], [], []
+    for item in golden:
+        expected = set(item['expected_sources'])
+
+        start = time.perf_counter()
+        results = retrieve(store, item['question'], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        sources = [result['source'] for result in results[:k]]
+        recalls.append(len(expected & set(sources)) / len(expected))
+        rank = next((i + 1 for i, source in enumerate(sources) if source in expected), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+
+        messages, _ = RAGPipeline.build_messages(item['question'], results, context_chars, k)
+        prompt_tokens.append(sum(count_tokens(message.content) for message in messages))
+        # Only the retrieved text counts: the prompt also repeats the question
+        context = '\n'.join(result['content'][:context_chars] for result in results[:k])
+        context_facts.append(_fact_recall(item.get('key_facts', []), context))
+        if llm is not None:
+            answer_facts.append(_fact_recall(item.get('key_facts', []), llm.invoke(messages).content))
+
+    latencies.sort()
+    return {
+        'recall@k': statistics.mean(recalls),
+        'mrr': statistics.mean(reciprocal_ranks),
+        'latency_p50_ms': latencies[len(latencies) // 2],
+        'latency_p95_ms': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        'prompt_tokens': statistics.mean(prompt_tokens),
+        'context_fact_recall': statistics.mean(context_facts),
+        'answer_fact_recall': statistics.mean(answer_facts) if answer_facts else None
+    }
+
+
+def sweep(data: List[Dict], golden: List[Dict], embeddings, chunk_sizes: List[int], overlaps: List[int],
+          top_ks: List[int], context_chars: List[int], llm=None) -> List[Dict]:
+    """Evaluate every parameter combination; the index is built once per chunking setup"""
+    # Query embeddings are fetched up front so no API call lands inside a latency measurement
+    # (the normalized question, which is what OfflineVectorStore.embed_query asks for)
+    for item in golden:
+        embeddings.embed_query(normalize_query(item['question']))
+
+    rows = []
+    for chunk_size in chunk_sizes:
+        for overlap in overlaps:
+            if overlap >= chunk_size:
+                continue
+            start = time.perf_counter()
+            store = OfflineVectorStore(data, embeddings, chunk_size, overlap)
+            build_s = time.perf_counter() - start
+            if isinstance(embeddings, CachedEmbeddings):
+                embeddings.save()
+            for k in top_ks:
+                for chars in context_chars:
+                    rows.append({
+                        'chunk_size': chunk_size, 'chunk_overlap': overlap, 'top_k': k, 'context_chars': chars,
+                        **store.size(), 'build_s': build_s,
+                        **evaluate(store, golden, k, chars, llm)
+                    })
+    return rows
+
+
+def _print_table(rows: List[Dict]):
+    print(f"{'chunk':>6} {'overlap':>7} {'k':>3} {'ctx':>5} {'recall@k':>8} {'MRR':>6} {'p50 ms':>7} "
+          f"{'p95 ms':>7} {'tokens':>7} {'ctx facts':>9} {'ans facts':>9} {'chunks':>7} {'index MB':>8}")
+    for row in rows:
+        answer = f"{row['answer_fact_recall']:9.2f}" if row['answer_fact_recall'] is not None else f"{'-':>9}"
+        print(f"{row['chunk_size']:>6} {row['chunk_overlap']:>7} {row['top_k']:>3} {row['context_chars']:>5} "
+              f"{row['recall@k']:8.3f} {row['mrr']:6.3f} {row['latency_p50_ms']:7.2f} {row['latency_p95_ms']:7.2f} "
+              f"{row['prompt_tokens']:7.0f} {row['context_fact_recall']:9.2f} {answer} {row['chunks']:>7} "
+              f"{row['text_mb'] + row['vectors_mb']:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep chunking / retrieval / prompt parameters over a golden set")
+    parser.add_argument("--golden", type=Path, default=config.GOLDEN_SET_FILE)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=config.EVAL_CHUNK_SIZES)
+    parser.add_argument("--overlaps", type=int, nargs="+", default=config.EVAL_CHUNK_OVERLAPS)
+    parser.add_argument("--top-k", type=int, nargs="+", default=config.EVAL_TOP_K)
+    parser.add_argument("--context-chars", type=int, nargs="+", default=config.EVAL_CONTEXT_CHARS)
+    parser.add_argument("--embeddings", choices=["cached", "hashing"], default="cached",
+                        help="cached: real embeddings, each text embedded once; hashing: offline stand-in")
+    parser.add_argument("--llm", choices=["none", "fake", "recorded"], default="none",
+                        help="answer model for answer_fact_recall (none skips answering)")
+    parser.add_argument("--record", action="store_true", help="with --llm recorded, call the real LLM for unrecorded prompts")
+    parser.add_argument("--output", type=Path, help="also write the rows as JSON")
+    args = parser.parse_args()
+
+    with open(args.golden, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+    for leak in leaked_facts(golden):
+        logger.warning(f"Key fact repeats the question, so it proves nothing: {leak}")
+    data = DataCollector().load_scraped_data()
+    if not data:
+        raise SystemExit("No scraped data found. Run: python data_collector.py")
+
+    if args.embeddings == "hashing":
+        embeddings = HashingEmbeddings()
+    else:
+        from langchain_community.embeddings import OpenAIEmbeddings
+        embeddings = CachedEmbeddings(OpenAIEmbeddings(model=config.EMBEDDING_MODEL),
+                                      config.EVAL_CACHE_DIR / f"embeddings-{config.EMBEDDING_MODEL}.npz")
+
+    llm = None
+    if args.llm == "fake":
+        llm = FakeLLM()
+    elif args.llm == "recorded":
+        live = None
+        if args.record:
+            from langchain_openai import ChatOpenAI
+            live = ChatOpenAI(model=config.LLM_MODEL, temperature=config.TEMPERATURE, max_tokens=config.MAX_TOKENS)
+        llm = RecordedLLM(config.EVAL_CACHE_DIR / f"llm-{config.LLM_MODEL}.json", live)
+
+    rows = sweep(data, golden, embeddings, args.chunk_sizes, args.overlaps, args.top_k, args.context_chars, llm)
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings.save()
+    if isinstance(llm, RecordedLLM):
+        llm.save()
+        if llm.missing:
+            logger.warning(f"{llm.missing} prompts had no recorded answer (use --record to fill them)")
+
+    print(f"{len(golden)} golden questions, {len(data)} sources")
+    _print_table(rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
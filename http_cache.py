@@ -0,0 +1,140 @@
+"""
+HTTP caching (ETag / Cache-Control) and response compression for query responses
+"""
+import base64
+import gzip
+import hashlib
+import json
+import logging
+from typing import Dict, Optional, Tuple
+import config
+from answer_catalog import catalog_version
+from query_router import get_router
+from utils import normalize_query, read_index_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CACHE_POLICIES = {
+    'answer': config.CACHE_CONTROL_ANSWER,
+    'advice': config.CACHE_CONTROL_ADVICE,
+    'error': config.CACHE_CONTROL_ERROR
+}
+
+
+def query_etag(query: str, index_version: Optional[str] = None, catalog: Optional[str] = None) -> str:
+    """Deterministic ETag: equal for questions that normalize alike, new after every index or catalog rebuild"""
+    index_version = index_version or read_index_version()
+    # Catalog answers are served ahead of the pipeline, so a rebuilt catalog must invalidate too
+    catalog = catalog if catalog is not None else catalog_version()
+    digest = hashlib.sha256(f"{index_version}|{catalog}|{normalize_query(query)}".encode('utf-8')).hexdigest()
+    # Weak, because gzip/brotli/identity bodies of the same answer share it
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in tags)
+
+
+def cache_policy(status: int, payload: Optional[Dict], error: bool = False) -> str:
+    """Cache-Control for a response: answers, advice refusals and errors are cached differently"""
+    if error or status >= 400 or not payload or payload.get('error') or payload.get('is_error'):
+        return CACHE_POLICIES['error']
+    if payload.get('is_advice'):
+        return CACHE_POLICIES['advice']
+    return CACHE_POLICIES['answer']
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Compress with the best encoding the client accepts (brotli, then gzip)"""
+    if len(body) < config.COMPRESSION_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return brotli.compress(body), 'br'
+    if accepted.get('gzip', 0) > 0:
+        return gzip.compress(body, mtime=0), 'gzip'
+    return body, None
+
+
+def get_header(headers, name: str) -> Optional[str]:
+    """Case-insensitive lookup in a request header mapping (None if absent)"""
+    if not headers:
+        return None
+    value = headers.get(name) or headers.get(name.lower())
+    if value is None:
+        lowered = name.lower()
+        value = next((v for k, v in headers.items() if k.lower() == lowered), None)
+    return value
+
+
+def cache_headers(status: int, payload: Optional[Dict], etag: Optional[str],
+                  error: bool = False) -> Dict[str, str]:
+    """Caching headers for a response: errors always get the error policy (and no ETag),
+    GET answers get their policy and validator, POST answers get none
+    """
+    policy = cache_policy(status, payload, error)
+    if policy == CACHE_POLICIES['error']:
+        return {'Cache-Control': policy}
+    if etag is None:
+        return {}
+    return {'Cache-Control': policy, 'Vary': 'Accept-Encoding', 'ETag': etag}
+
+
+def not_modified_response(query: str, headers: Dict[str, str], etag: str) -> Dict:
+    """Serverless-style 304 for a client that already holds the current answer"""
+    # Same Cache-Control the full response would carry; routing alone tells a refusal apart
+    payload = {'is_advice': get_router().route(query)['is_advice']}
+    return {"statusCode": 304, "headers": {**headers, **cache_headers(200, payload, etag)}, "body": ""}
+
+
+def json_response(status: int, payload: Dict, headers: Dict[str, str], request_headers=None,
+                  etag: Optional[str] = None, error: bool = False) -> Dict:
+    """Serverless-style JSON response with caching headers (GET only) and a compressed body
+
+    Pass `etag` for GET requests; POST answers get no caching headers or validators.
+    Errors (status >= 400, or `error` for a 200 that carries the pipeline's apology) always
+    get CACHE_CONTROL_ERROR, whatever the method.
+    """
+    headers = dict(headers)
+    headers.update(cache_headers(status, payload, etag, error))
+
+    body, encoding = compress(json.dumps(payload).encode('utf-8'),
+                              get_header(request_headers, 'Accept-Encoding'))
+    if encoding is None:
+        return {"statusCode": status, "headers": headers, "body": body.decode('utf-8')}
+
+    headers['Content-Encoding'] = encoding
+    headers.setdefault('Vary', 'Accept-Encoding')
+    return {
+        "statusCode": status,
+        "headers": headers,
+        "body": base64.b64encode(body).decode('ascii'),
+        "isBase64Encoded": True
+    }
@@ -0,0 +1,149 @@
+"""
+In-memory BM25 inverted index used as a lexical fast path ahead of vector search
+"""
+import json
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from langchain.schema import Document
+import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Question words carry no signal for BM25 and only dilute the decisiveness check
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from',
+    'how', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'or', 'the', 'this', 'to',
+    'what', 'when', 'where', 'which', 'who', 'why', 'with'
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stopwords"""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = config.RRF_K) -> List[Document]:
+    """Merge several ranked document lists into one, scale-free"""
+    scores: Dict[Tuple[str, str], float] = defaultdict(float)
+    docs: Dict[Tuple[str, str], Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = (doc.metadata.get('source', ''), doc.page_content)
+            scores[key] += 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [docs[key] for key in ordered]
+
+
+class BM25Index:
+    """Okapi BM25 over the same chunks that are embedded into the vector store"""
+
+    def __init__(self, k1: float = config.BM25_K1, b: float = config.BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[Document] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.avg_doc_length = 0.0
+        self.idf: Dict[str, float] = {}
+
+    def build(self, documents: List[Document]):
+        """Index the given documents, replacing any previous contents"""
+        self.documents = list(documents)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths = []
+
+        for idx, doc in enumerate(self.documents):
+            tokens = tokenize(doc.page_content)
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((idx, tf))
+
+        self.postings = dict(postings)
+        n_docs = len(self.documents)
+        self.avg_doc_length = sum(self.doc_lengths) / n_docs if n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+        logger.info(f"BM25 index built with {n_docs} documents and {len(self.postings)} terms")
+
+    def _matches_filters(self, doc: Document, filters: Optional[Dict]) -> bool:
+        if not filters:
+            return True
+        return all(doc.metadata.get(key) == value for key, value in filters.items())
+
+    def search(self, query: str, k: int = config.TOP_K_RESULTS,
+               filters: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Return up to k (document, normalized score) pairs, best first
+
+        Scores are divided by the score of a document matching every query term
+        once at average length (capped at 1), so they can be compared against
+        config.LEXICAL_MIN_SCORE.
+        """
+        query_terms = set(tokenize(query))
+        terms = [term for term in query_terms if term in self.postings]
+        if not terms or not self.documents:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in terms:
+            idf = self.idf[term]
+            for idx, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[idx] / (self.avg_doc_length or 1)
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        # Reference counts every query term, so unmatched identifiers lower confidence
+        unseen_idf = max(self.idf.values())
+        reference = sum(self.idf.get(term, unseen_idf) for term in query_terms)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        results = []
+        for idx, score in ranked:
+            doc = self.documents[idx]
+            if self._matches_filters(doc, filters):
+                results.append((doc, min(1.0, score / reference)))
+                if len(results) >= k:
+                    break
+        return results
+
+    @staticmethod
+    def is_decisive(results: List[Tuple[Document, float]]) -> bool:
+        """Whether the lexical ranking is confident enough to skip vector search"""
+        if not results or results[0][1] < config.LEXICAL_MIN_SCORE:
+            return False
+        if len(results) == 1:
+            return True
+        return results[0][1] >= config.LEXICAL_DECISIVE_RATIO * results[1][1]
+
+    def save(self, path: Path):
+        """Persist the indexed chunks; postings are rebuilt on load"""
+        payload = {
+            'k1': self.k1,
+            'b': self.b,
+            'documents': [
+                {'page_content': doc.page_content, 'metadata': doc.metadata}
+                for doc in self.documents
+            ]
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: Path) -> 'BM25Index':
+        """Load an index saved with save()"""
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        index = cls(k1=payload.get('k1', config.BM25_K1), b=payload.get('b', config.BM25_B))
+        index.build([
+            Document(page_content=item['page_content'], metadata=item.get('metadata', {}))
+            for item in payload.get('documents', [])
+        ])
+        return index
@@ -4,17 +4,26 @@ Netlify serverless function for handling RAG queries
 import os
 import json
 import sys
+import time
 from pathlib import Path
 
 # Add parent directory to path for imports
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
+from http_cache import etag_matches, get_header, json_response, not_modified_response, query_etag
+from query_log import log_query
+
 try:
     from rag_pipeline import RAGPipeline
 except ImportError:
     # Handle import errors gracefully
     RAGPipeline = None
 
+try:
+    from answer_catalog import lookup_answer
+except ImportError:
+    lookup_answer = None
+
 # Initialize pipeline (cached across invocations)
 pipeline = None
 
@@ -42,6 +51,7 @@ def handler(event, context):
         "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
         "Access-Control-Allow-Headers": "Content-Type"
     }
+    request_headers = event.get("headers")
     
     # Handle OPTIONS request
     if event["httpMethod"] == "OPTIONS":
@@ -60,38 +70,38 @@ def handler(event, context):
             query = body.get("query", "")
         
         if not query:
-            return {
-                "statusCode": 400,
-                "headers": headers,
-                "body": json.dumps({"error": "Query parameter is required"})
-            }
+            return json_response(400, {"error": "Query parameter is required"}, headers, request_headers)
+        
+        # GET answers are cacheable: the ETag only changes with the question or the index
+        etag = query_etag(query) if event["httpMethod"] == "GET" else None
+        if etag and etag_matches(get_header(request_headers, "If-None-Match"), etag):
+            return not_modified_response(query, headers, etag)
+        
+        # Common questions are answered from the precomputed catalog without loading the pipeline
+        lookup_start = time.perf_counter()
+        cached = lookup_answer(query) if lookup_answer else None
+        if cached:
+            log_query(query, "catalog", (time.perf_counter() - lookup_start) * 1000, cached["source"])
+            return json_response(200, {
+                "answer": cached["answer"],
+                "source": cached["source"],
+                "is_advice": cached.get("is_advice", False)
+            }, headers, request_headers, etag)
         
         # Initialize pipeline
         rag_pipeline = init_pipeline()
         if rag_pipeline is None:
-            return {
-                "statusCode": 500,
-                "headers": headers,
-                "body": json.dumps({"error": "Pipeline initialization failed. Please ensure OPENAI_API_KEY is set and vector store is initialized."})
-            }
+            return json_response(500, {"error": "Pipeline initialization failed. Please ensure OPENAI_API_KEY is set and vector store is initialized."}, headers, request_headers)
         
         # Generate response
         response = rag_pipeline.generate_response(query)
         
-        return {
-            "statusCode": 200,
-            "headers": headers,
-            "body": json.dumps({
-                "answer": response["answer"],
-                "source": response["source"],
-                "is_advice": response["is_advice"]
-            })
-        }
+        return json_response(200, {
+            "answer": response["answer"],
+            "source": response["source"],
+            "is_advice": response["is_advice"]
+        }, headers, request_headers, etag, error=response.get("is_error", False))
         
     except Exception as e:
-        return {
-            "statusCode": 500,
-            "headers": headers,
-            "body": json.dumps({"error": str(e)})
-        }
+        return json_response(500, {"error": str(e)}, headers, request_headers)
 
@@ -0,0 +1,286 @@
+"""
+Linked PDF collection: discover the KIM / SID / addenda PDFs, stream them to disk and index them page by page
+
+Usage:
+    python pdf_collector.py                 # download new/changed PDFs and index them
+    python pdf_collector.py --force-index   # re-index every downloaded PDF (after a full rebuild)
+    python pdf_collector.py --list          # show the manifest
+
+Downloads are streamed in PDF_DOWNLOAD_CHUNK_BYTES reads and hashed as they are written;
+text is extracted one page at a time and indexed in batches of PDF_PAGES_PER_BATCH pages,
+so memory does not grow with the size of a document. A PDF whose sha256 matches the one
+already indexed is skipped.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import requests
+import config
+from data_collector import DataCollector
+from query_router import source_key_for_url
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def pdf_filename(url: str) -> str:
+    """Stable local file name for a PDF URL"""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:24] + '.pdf'
+
+
+def iter_pdf_pages(path: Path) -> Iterator[Tuple[int, str]]:
+    """Yield (1-based page number, text) one page at a time; pages without text are skipped"""
+    if PdfReader is None:
+        raise ImportError("pypdf is required for PDF extraction (pip install pypdf)")
+    # A file handle (not a path) keeps the PDF on disk: given a path, pypdf reads it all into memory
+    with open(path, 'rb') as f:
+        reader = PdfReader(f)
+        for index in range(len(reader.pages)):
+            page_no = index + 1
+            try:
+                text = reader.pages[index].extract_text() or ''
+            except Exception as e:
+                logger.warning(f"Could not extract page {page_no} of {path.name}: {e}")
+                text = ''
+            if page_no % config.PDF_PAGES_PER_BATCH == 0:
+                # pypdf caches every object it has parsed; dropping the cache keeps memory flat
+                reader.resolved_objects.clear()
+            text = ' '.join(text.split())
+            if text:
+                yield page_no, text
+
+
+def iter_page_items(path: Path, link: Dict) -> Iterator[Dict]:
+    """Scraped-page-shaped items (one per PDF page) ready for VectorStore.iter_documents_from_data"""
+    title = link.get('text') or Path(link['url']).name
+    if link.get('parent_title'):
+        title = f"{title} ({link['parent_title']})"
+    for page_no, text in iter_pdf_pages(path):
+        yield {
+            'url': f"{link['url']}#page={page_no}",
+            'title': f"{title} - page {page_no}",
+            'content': text,
+            'parent_url': link.get('parent_url', ''),
+            'document': link['url']
+        }
+
+
+class PDFCollector:
+    """Downloads linked PDFs incrementally and keeps their chunks in the index up to date"""
+
+    def __init__(self, pdf_dir: Path = config.PDF_DIR, manifest_file: Path = config.PDF_MANIFEST_FILE):
+        self.pdf_dir = Path(pdf_dir)
+        self.pdf_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = Path(manifest_file)
+        self.collector = DataCollector()
+        self.manifest: Dict[str, Dict] = self._load_manifest()
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if self.manifest_file.exists():
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read PDF manifest, starting fresh: {e}")
+        return {}
+
+    def save_manifest(self):
+        tmp_path = self.manifest_file.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        tmp_path.replace(self.manifest_file)
+
+    def discover(self, source_keys: List[str] = config.PDF_SOURCE_KEYS) -> List[Dict]:
+        """PDF links on the given sources' pages (from the last scrape, re-fetched if it predates PDF links)"""
+        scraped = {source_key_for_url(item.get('url', '')): item for item in self.collector.load_scraped_data()}
+        links = {}
+        for source_key in source_keys:
+            page = scraped.get(source_key)
+            if page is None or 'pdf_links' not in page:
+                page = self.collector.fetch_page(config.SOURCE_URLS[source_key])
+                if page is None:
+                    continue
+            for link in page['pdf_links'][:config.PDF_MAX_PER_SOURCE]:
+                links.setdefault(link['url'], {
+                    **link,
+                    'parent_url': page['url'],
+                    'parent_title': page.get('title', '')
+                })
+        logger.info(f"Discovered {len(links)} linked PDFs on {len(source_keys)} source pages")
+        return list(links.values())
+
+    def download(self, link: Dict, timeout: int = 60) -> Optional[Path]:
+        """Stream one PDF to disk; returns its path, or None if it failed or is too large
+
+        Sends the stored validators, so an unchanged PDF costs a 304 rather than a download.
+        """
+        url = link['url']
+        entry = self.manifest.get(url, {})
+        path = self.pdf_dir / pdf_filename(url)
+        headers = {}
+        if path.exists():
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        tmp_path = path.with_suffix('.part')
+        try:
+            with self.collector.session.get(url, headers=headers, timeout=timeout, stream=True) as response:
+                if response.status_code == 304:
+                    logger.info(f"Not modified: {url}")
+                    return path
+                response.raise_for_status()
+                declared = int(response.headers.get('Content-Length') or 0)
+                if declared > config.PDF_MAX_BYTES:
+                    logger.warning(f"Skipping {url}: {declared} bytes exceeds PDF_MAX_BYTES")
+                    return None
+
+                digest = hashlib.sha256()
+                size = 0
+                with open(tmp_path, 'wb') as f:
+                    for block in response.iter_content(chunk_size=config.PDF_DOWNLOAD_CHUNK_BYTES):
+                        size += len(block)
+                        if size > config.PDF_MAX_BYTES:
+                            raise ValueError(f"exceeds PDF_MAX_BYTES ({config.PDF_MAX_BYTES} bytes)")
+                        digest.update(block)
+                        f.write(block)
+                tmp_path.replace(path)
+        except (requests.RequestException, OSError, ValueError) as e:
+            logger.error(f"Error downloading {url}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return None
+
+        self.manifest[url] = {
+            **entry,
+            'text': link.get('text', ''),
+            'parent_url': link.get('parent_url', ''),
+            'parent_title': link.get('parent_title', ''),
+            'file': path.name,
+            'sha256': digest.hexdigest(),
+            'bytes': size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'downloaded_at': time.time()
+        }
+        logger.info(f"Downloaded {url} ({size / 1024 / 1024:.1f} MB)")
+        return path
+
+    def _store(self):
+        if config.ENABLE_SHARDING:
+            from sharding import ShardedVectorStore
+            store = ShardedVectorStore()
+        else:
+            from vector_store import VectorStore
+            store = VectorStore()
+        store.load_vector_store()
+        return store
+
+    def index_pdf(self, store, path: Path, link: Dict) -> int:
+        """Replace a PDF's chunks in the index, adding its pages in bounded batches
+        
+        Each batch only goes into Chroma; the lexical index, exported vectors and index version
+        are updated once per PDF (or every MAX_PENDING_CHUNKS chunks), not once per batch.
+        """
+        from dedup import ChunkDeduplicator
+
+        url = link['url']
+        store.remove_documents([url], field='document')
+        pages = iter_page_items(path, link)
+        total = 0
+        try:
+            while True:
+                batch = [item for _, item in zip(range(config.PDF_PAGES_PER_BATCH), pages)]
+                if not batch:
+                    break
+                documents = list(store.iter_documents_from_data(batch))
+                if config.DEDUP_ENABLED and documents:
+                    # Running headers and footers repeat on every page
+                    documents, _ = ChunkDeduplicator().deduplicate(documents)
+                if documents:
+                    store.add_documents(documents, defer=True)
+                    total += len(documents)
+        finally:
+            # Also after a failed page, so the other indexes match what reached Chroma
+            store.flush_additions()
+        logger.info(f"Indexed {total} chunks from {url}")
+        return total
+
+    def run(self, links: Optional[List[Dict]] = None, force_index: bool = False, store=None) -> List[str]:
+        """Download new or changed PDFs and index those whose content changed; returns their URLs"""
+        if PdfReader is None:
+            logger.warning("pypdf is not installed; skipping linked PDFs")
+            return []
+        links = self.discover() if links is None else links
+
+        indexed = []
+        for i, link in enumerate(links):
+            if i:
+                time.sleep(config.REFRESH_POLITENESS_DELAY)
+            path = self.download(link)
+            entry = self.manifest.get(link['url'])
+            if path is None or entry is None:
+                continue
+            if not force_index and entry.get('indexed_sha256') == entry['sha256']:
+                logger.info(f"Unchanged since last indexed: {link['url']}")
+                continue
+
+            store = store or self._store()
+            try:
+                self.index_pdf(store, path, link)
+            except Exception as e:
+                logger.error(f"Error indexing {link['url']}: {e}")
+                continue
+            entry['indexed_sha256'] = entry['sha256']
+            indexed.append(link['url'])
+            # Saved per PDF, so an interrupted run resumes where it stopped
+            self.save_manifest()
+
+        self.save_manifest()
+        logger.info(f"Indexed {len(indexed)} of {len(links)} linked PDFs")
+        return indexed
+
+    def force_index(self, store=None) -> List[str]:
+        """Re-index every downloaded PDF from disk (a full rebuild drops their chunks)"""
+        links = [
+            {'url': url, **{key: entry[key] for key in ('text', 'parent_url', 'parent_title') if key in entry}}
+            for url, entry in self.manifest.items()
+            if (self.pdf_dir / entry.get('file', '')).is_file()
+        ]
+        if not links or PdfReader is None:
+            return []
+        store = store or self._store()
+        indexed = []
+        for link in links:
+            entry = self.manifest[link['url']]
+            self.index_pdf(store, self.pdf_dir / entry['file'], link)
+            entry['indexed_sha256'] = entry['sha256']
+            indexed.append(link['url'])
+        self.save_manifest()
+        return indexed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect and index PDFs linked from the KIM / SID / addenda pages")
+    parser.add_argument("--force-index", action="store_true", help="re-index every downloaded PDF from disk")
+    parser.add_argument("--list", action="store_true", help="print the manifest and exit")
+    args = parser.parse_args()
+
+    pdf_collector = PDFCollector()
+    if args.list:
+        for url, entry in sorted(pdf_collector.manifest.items()):
+            state = 'indexed' if entry.get('indexed_sha256') == entry.get('sha256') else 'pending'
+            print(f"{state:<8} {entry.get('bytes', 0) / 1024 / 1024:7.1f} MB  {url}")
+    elif args.force_index:
+        pdf_collector.force_index()
+    else:
+        pdf_collector.run()
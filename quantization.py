@@ -0,0 +1,229 @@
+"""
+Compressed (int8 / binary) embedding codes for candidate generation
+
+Usage (benchmark against exact search on synthetic vectors):
+    python quantization.py [--n 100000] [--dim 1536] [--k 10]
+"""
+import argparse
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Set bits per byte"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT[values]
+
+
+class Int8Quantizer:
+    """Symmetric per-vector int8 codes: 4x smaller than float32"""
+
+    name = "int8"
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def encode(cls, embeddings: np.ndarray, block: int = config.QUANTIZED_SCAN_BLOCK) -> 'Int8Quantizer':
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        scales = np.empty(len(embeddings), dtype=np.float32)
+        for start in range(0, len(embeddings), block):
+            rows = np.asarray(embeddings[start:start + block], dtype=np.float32)
+            peak = np.abs(rows).max(axis=1)
+            peak[peak == 0] = 1.0
+            scales[start:start + block] = peak / 127.0
+            codes[start:start + block] = np.round(rows / (peak[:, None] / 127.0)).astype(np.int8)
+        return cls(codes, scales)
+
+    def scores(self, query: np.ndarray, block: int = config.QUANTIZED_SCAN_BLOCK) -> np.ndarray:
+        """Approximate dot products with a float32 query"""
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), block):
+            rows = self.codes[start:start + block].astype(np.float32)
+            out[start:start + block] = (rows @ query) * self.scales[start:start + block]
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    def save(self, directory: Path):
+        np.save(directory / "embeddings_int8.npy", self.codes)
+        np.save(directory / "embeddings_int8_scales.npy", self.scales)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional['Int8Quantizer']:
+        codes_path = directory / "embeddings_int8.npy"
+        scales_path = directory / "embeddings_int8_scales.npy"
+        if not codes_path.exists() or not scales_path.exists():
+            return None
+        return cls(np.load(codes_path), np.load(scales_path))
+
+
+class BinaryQuantizer:
+    """Sign-bit codes compared by Hamming distance: 32x smaller than float32"""
+
+    name = "binary"
+
+    def __init__(self, codes: np.ndarray, dim: int):
+        self.codes = codes
+        self.dim = dim
+
+    @classmethod
+    def encode(cls, embeddings: np.ndarray, block: int = config.QUANTIZED_SCAN_BLOCK) -> 'BinaryQuantizer':
+        dim = embeddings.shape[1]
+        codes = np.empty((len(embeddings), (dim + 7) // 8), dtype=np.uint8)
+        for start in range(0, len(embeddings), block):
+            codes[start:start + block] = np.packbits(np.asarray(embeddings[start:start + block]) > 0, axis=1)
+        return cls(codes, dim)
+
+    def scores(self, query: np.ndarray, block: int = config.QUANTIZED_SCAN_BLOCK) -> np.ndarray:
+        """Agreeing minus disagreeing sign bits (higher is more similar)"""
+        query_code = np.packbits(query > 0)
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), block):
+            hamming = _popcount(self.codes[start:start + block] ^ query_code).sum(axis=1, dtype=np.int32)
+            out[start:start + block] = self.dim - 2 * hamming
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+    def save(self, directory: Path):
+        np.save(directory / "embeddings_binary.npy", self.codes)
+
+    @classmethod
+    def load(cls, directory: Path, dim: int) -> Optional['BinaryQuantizer']:
+        codes_path = directory / "embeddings_binary.npy"
+        if not codes_path.exists():
+            return None
+        return cls(np.load(codes_path), dim)
+
+
+QUANTIZERS = {
+    Int8Quantizer.name: Int8Quantizer,
+    BinaryQuantizer.name: BinaryQuantizer,
+}
+
+
+CODE_FILES = ("embeddings_int8.npy", "embeddings_int8_scales.npy", "embeddings_binary.npy")
+
+
+def remove_codes(directory: Path):
+    """Delete saved codes so they are re-encoded from freshly exported embeddings"""
+    for name in CODE_FILES:
+        (directory / name).unlink(missing_ok=True)
+
+
+def load_or_build(directory: Path, embeddings: np.ndarray, mode: str):
+    """Load the codes for `mode` saved next to the embeddings, encoding them if missing"""
+    if mode not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization mode: {mode} (expected one of {sorted(QUANTIZERS)})")
+    if mode == BinaryQuantizer.name:
+        quantizer = BinaryQuantizer.load(directory, embeddings.shape[1])
+    else:
+        quantizer = Int8Quantizer.load(directory)
+    if quantizer is None or len(quantizer.codes) != len(embeddings):
+        quantizer = QUANTIZERS[mode].encode(embeddings)
+        quantizer.save(directory)
+        logger.info(f"Encoded {len(embeddings)} embeddings as {mode} codes ({quantizer.nbytes} bytes)")
+    return quantizer
+
+
+def shortlist(scores: np.ndarray, n: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Indices of the n best approximate scores, optionally within a row mask"""
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.isfinite(scores[top])]
+
+
+def rerank(embeddings: np.ndarray, candidates: np.ndarray, query: np.ndarray, k: int):
+    """Exact re-scoring of a shortlist; only the shortlisted rows are read from disk"""
+    candidates = np.sort(candidates)  # sequential reads through the memmap
+    exact = np.asarray(embeddings[candidates], dtype=np.float32) @ query
+    order = np.argsort(-exact, kind='stable')[:k]
+    return candidates[order], exact[order]
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors, closer to real embedding geometry than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=n)] + 0.8 * rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def synthetic_queries(embeddings: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Unit queries near randomly chosen stored vectors"""
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.integers(0, len(embeddings), size=count)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def benchmark(n: int = 100000, dim: int = 1536, k: int = 10, queries: int = 50,
+              candidates: int = config.QUANTIZED_RERANK_CANDIDATES, seed: int = 0) -> Dict[str, Dict]:
+    """Recall@k, memory and per-query latency of each quantizer versus exact search"""
+    embeddings = synthetic_embeddings(n, dim, clusters=max(1, n // 500), seed=seed)
+    query_vectors = synthetic_queries(embeddings, queries, seed=seed + 1)
+
+    start = time.perf_counter()
+    truth = []
+    for query in query_vectors:
+        scores = embeddings @ query
+        truth.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / queries
+
+    report = {'exact': {'recall': 1.0, 'bytes': embeddings.nbytes, 'ms_per_query': exact_ms, 'speedup': 1.0}}
+    for mode, quantizer_cls in QUANTIZERS.items():
+        quantizer = quantizer_cls.encode(embeddings)
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(query_vectors, truth):
+            shortlisted = shortlist(quantizer.scores(query), max(k, candidates))
+            top, _ = rerank(embeddings, shortlisted, query, k)
+            hits += len(expected & set(top.tolist()))
+        elapsed_ms = (time.perf_counter() - start) * 1000 / queries
+        report[mode] = {
+            'recall': hits / (k * queries),
+            'bytes': quantizer.nbytes,
+            'ms_per_query': elapsed_ms,
+            'speedup': exact_ms / elapsed_ms if elapsed_ms else float('inf'),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark quantized embedding search against exact search")
+    parser.add_argument("--n", type=int, default=100000, help="number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--candidates", type=int, default=config.QUANTIZED_RERANK_CANDIDATES)
+    args = parser.parse_args()
+
+    results = benchmark(args.n, args.dim, args.k, args.queries, args.candidates)
+    full_bytes = results['exact']['bytes']
+    print(f"{args.n} vectors x {args.dim} dims, recall@{args.k}, {args.candidates} re-ranked candidates")
+    print(f"{'mode':8} {'recall':>8} {'memory MB':>10} {'saved':>7} {'ms/query':>9} {'speedup':>8}")
+    for mode, row in results.items():
+        saved = 1 - row['bytes'] / full_bytes
+        print(f"{mode:8} {row['recall']:8.3f} {row['bytes'] / 1e6:10.1f} {saved:7.1%} "
+              f"{row['ms_per_query']:9.2f} {row['speedup']:7.2f}x")
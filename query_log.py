@@ -0,0 +1,258 @@
+"""
+Opt-in structured query log with hot-query analytics and cache warming
+
+Usage:
+    MF_QUERY_LOG=1 python server.py                # record queries (any entry point)
+    python query_log.py report [--top 20] [--days 7]
+    python query_log.py warm [--top 50]            # after every index rebuild
+
+Entries are queued by the request thread and written in batches by a background
+thread, so logging never blocks or fails a query.
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import config
+from utils import normalize_query
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Serving paths that produced a real answer; only these are worth caching
+ANSWERED_PATHS = ('catalog', 'lexical', 'hybrid')
+
+
+class QueryLogWriter:
+    """Background, batching, size-rotated JSON-lines writer (one file per process)"""
+
+    def __init__(self, directory: Path = config.QUERY_LOG_DIR):
+        self.directory = Path(directory)
+        self.dropped = 0
+        self._pid = None
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"queries-{os.getpid()}.jsonl"
+
+    def _ensure_thread(self):
+        # Threads do not survive fork: a forked server worker starts its own writer
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._queue = queue.Queue(maxsize=config.QUERY_LOG_QUEUE_SIZE)
+            self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def record(self, entry: Dict):
+        """Queue an entry; drops it (and counts the drop) if the writer has fallen behind"""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + config.QUERY_LOG_FLUSH_INTERVAL
+        while True:
+            try:
+                entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if entry is _STOP:
+                    self._write(batch)
+                    return
+                batch.append(entry)
+            except queue.Empty:
+                pass
+            if len(batch) >= config.QUERY_LOG_BATCH_SIZE or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + config.QUERY_LOG_FLUSH_INTERVAL
+
+    def _write(self, batch: List[Dict]):
+        if not batch:
+            return
+        try:
+            path = self.path
+            if path.exists() and path.stat().st_size >= config.QUERY_LOG_MAX_BYTES:
+                self._rotate(path)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in batch))
+        except OSError as e:
+            logger.warning(f"Query log write failed, dropping {len(batch)} entries: {e}")
+            self.dropped += len(batch)
+
+    @staticmethod
+    def _rotate(path: Path):
+        """queries-<pid>.jsonl -> .jsonl.1 -> ... -> .jsonl.<QUERY_LOG_BACKUPS> (oldest deleted)"""
+        for i in range(config.QUERY_LOG_BACKUPS, 0, -1):
+            older = path.with_name(f"{path.name}.{i}")
+            if i == config.QUERY_LOG_BACKUPS:
+                older.unlink(missing_ok=True)
+            else:
+                newer = path.with_name(f"{path.name}.{i + 1}")
+                if older.exists():
+                    older.replace(newer)
+        path.replace(path.with_name(f"{path.name}.1"))
+
+    def close(self, timeout: float = 5.0):
+        """Flush what is queued and stop the writer thread"""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._pid = None
+
+
+_writer: Optional[QueryLogWriter] = None
+
+
+def log_query(query: str, path: str, latency_ms: float, source: Optional[str] = None):
+    """Record one served query (no-op unless QUERY_LOG_ENABLED)"""
+    global _writer
+    if not config.QUERY_LOG_ENABLED:
+        return
+    if _writer is None:
+        _writer = QueryLogWriter()
+    _writer.record({
+        'ts': round(time.time(), 3),
+        'query': normalize_query(query),
+        'path': path,
+        'latency_ms': round(latency_ms, 1),
+        'source': source
+    })
+
+
+def read_entries(directory: Path = config.QUERY_LOG_DIR, since: Optional[float] = None) -> Iterator[Dict]:
+    """All logged entries (current and rotated files), optionally only those after `since`"""
+    for path in sorted(Path(directory).glob("queries-*.jsonl*")):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if since is None or entry.get('ts', 0) >= since:
+                    yield entry
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def analyze(entries: List[Dict], top: int = 20, catalog: Optional[Dict] = None) -> Dict:
+    """Top queries, latency per serving path and how much traffic caching could absorb"""
+    counts = Counter(entry['query'] for entry in entries)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    for entry in entries:
+        latencies[entry['path']].append(entry['latency_ms'])
+
+    total = len(entries)
+    top_queries = counts.most_common(top)
+    hot_set = counts.most_common(config.HOT_QUERY_COUNT)
+    catalog = catalog or {}
+    return {
+        'total': total,
+        'unique': len(counts),
+        'top_queries': [(query, count, count / total) for query, count in top_queries],
+        'latency': {
+            path: {
+                'count': len(values),
+                'p50': _percentile(sorted(values), 0.50),
+                'p90': _percentile(sorted(values), 0.90),
+                'p99': _percentile(sorted(values), 0.99)
+            }
+            for path, values in sorted(latencies.items())
+        },
+        # Upper bound for an exact-match cache: every query after its first occurrence
+        'repeat_share': (total - len(counts)) / total if total else 0.0,
+        # Traffic a catalog of the HOT_QUERY_COUNT most frequent queries would answer
+        'hot_set_share': sum(count for _, count in hot_set) / total if total else 0.0,
+        # Traffic the current answer catalog already covers
+        'catalog_share': sum(count for query, count in counts.items() if query in catalog) / total if total else 0.0
+    }
+
+
+def hot_queries(entries: List[Dict], top: int = config.HOT_QUERY_COUNT) -> List[str]:
+    """Most frequent normalized queries that were answered (refusals, misses and errors are not warmed)"""
+    counts = Counter(entry['query'] for entry in entries if entry['path'] in ANSWERED_PATHS)
+    return [query for query, _ in counts.most_common(top)]
+
+
+def warm(queries: List[str], pipeline=None, catalog: bool = True):
+    """Pre-compute query embeddings and catalog answers for the hot set"""
+    from answer_catalog import build_catalog, write_catalog
+    from embedding_cache import get_embedding_cache
+
+    if pipeline is None:
+        from rag_pipeline import RAGPipeline
+        pipeline = RAGPipeline()
+
+    cache = get_embedding_cache()
+    # Keys and embedded text are both the normalized query, as for live cache misses
+    missing = list(dict.fromkeys(normalize_query(query) for query in queries if query not in cache))
+    if missing:
+        # One batched embedding request instead of one call per query
+        for query, embedding in zip(missing, pipeline.vector_store.embeddings.embed_documents(missing)):
+            cache.put(query, embedding)
+    cache.save()
+    logger.info(f"Embedding cache warmed: {len(missing)} new of {len(queries)} hot queries")
+
+    if catalog:
+        questions = list(dict.fromkeys(config.CATALOG_QUESTIONS + queries))
+        write_catalog(build_catalog(questions, pipeline))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query log analytics and cache warming")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="top queries, latency and cache hit potential")
+    report_parser.add_argument("--top", type=int, default=20)
+    report_parser.add_argument("--days", type=float, help="only entries from the last N days")
+    warm_parser = subparsers.add_parser("warm", help="pre-warm embedding cache and answer catalog")
+    warm_parser.add_argument("--top", type=int, default=config.HOT_QUERY_COUNT)
+    warm_parser.add_argument("--days", type=float, help="only entries from the last N days")
+    warm_parser.add_argument("--no-catalog", action="store_true", help="warm only the embedding cache")
+    args = parser.parse_args()
+
+    since = time.time() - args.days * 86400 if args.days else None
+    entries = list(read_entries(since=since))
+    if not entries:
+        raise SystemExit(f"No query log entries in {config.QUERY_LOG_DIR} (set MF_QUERY_LOG=1 to record)")
+
+    if args.command == "report":
+        from answer_catalog import load_catalog
+
+        stats = analyze(entries, args.top, load_catalog())
+        print(f"{stats['total']} queries, {stats['unique']} unique")
+        print(f"\nTop {args.top} queries:")
+        for query, count, share in stats['top_queries']:
+            print(f"{count:>7} {share:6.1%}  {query}")
+        print(f"\n{'path':<12} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+        for path, row in stats['latency'].items():
+            print(f"{path:<12} {row['count']:>7} {row['p50']:8.1f} {row['p90']:8.1f} {row['p99']:8.1f}")
+        print(f"\nRepeated queries (exact-match cache ceiling): {stats['repeat_share']:.1%}")
+        print(f"Top {config.HOT_QUERY_COUNT} queries' share of traffic: {stats['hot_set_share']:.1%}")
+        print(f"Already answered by the catalog: {stats['catalog_share']:.1%}")
+    else:
+        warm(hot_queries(entries, args.top), catalog=not args.no_catalog)
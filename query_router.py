@@ -0,0 +1,146 @@
+"""
+Single-pass query routing: advice intent, scheme, document type and attribute
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+import config
+
+ADVICE = "advice"
+SCHEME = "scheme"
+DOC_TYPE = "doc_type"
+ATTRIBUTE = "attribute"
+
+
+class QueryRouter:
+    """Routes a query with one compiled multi-pattern regex instead of per-keyword scans"""
+
+    def __init__(self,
+                 advice_keywords: List[str] = config.ADVICE_KEYWORDS,
+                 scheme_keywords: Dict[str, str] = config.SCHEME_KEYWORDS,
+                 doc_type_keywords: Dict[str, str] = config.DOC_TYPE_KEYWORDS,
+                 attribute_keywords: Dict[str, str] = config.ATTRIBUTE_KEYWORDS):
+        # One phrase may mean several things (e.g. "statement" is a doc type and an attribute)
+        self._targets: Dict[str, List[Tuple[str, str]]] = {}
+        for phrase in advice_keywords:
+            self._add(phrase, ADVICE, phrase)
+        for kind, keywords in ((SCHEME, scheme_keywords),
+                               (DOC_TYPE, doc_type_keywords),
+                               (ATTRIBUTE, attribute_keywords)):
+            for phrase, value in keywords.items():
+                self._add(phrase, kind, value)
+
+        # Advice keywords keep the original substring semantics from the start of a word
+        # ("recommend" catches "recommendation"); the other phrases must match whole words.
+        # Longest phrases first so "should i buy" wins over "should i" at the same position;
+        # the empty-or-lookahead groups try both kinds at every word start in one scan
+        advice = sorted({phrase.lower() for phrase in advice_keywords}, key=len, reverse=True)
+        phrases = sorted((phrase for phrase, targets in self._targets.items()
+                          if any(kind != ADVICE for kind, _ in targets)), key=len, reverse=True)
+        self._pattern = re.compile(
+            r'\b(?:(?=(' + '|'.join(map(re.escape, advice)) + r'))|)'
+            r'(?:(?=(' + '|'.join(map(re.escape, phrases)) + r')\b)|)'
+        )
+
+    def _add(self, phrase: str, kind: str, value: str):
+        targets = self._targets.setdefault(phrase.lower(), [])
+        if (kind, value) not in targets:
+            targets.append((kind, value))
+
+    def route(self, query: str) -> Dict:
+        """Classify a query in a single pass over its text
+
+        Returns a dict with 'is_advice' (bool) and 'scheme', 'doc_type' and
+        'attribute' (first mention of each, or None).
+        """
+        route = {'is_advice': False, SCHEME: None, DOC_TYPE: None, ATTRIBUTE: None}
+        for match in self._pattern.finditer(query.lower()):
+            if match.group(1):
+                route['is_advice'] = True
+            if match.group(2):
+                for kind, value in self._targets[match.group(2)]:
+                    if kind != ADVICE and route[kind] is None:
+                        route[kind] = value
+        return route
+
+    @staticmethod
+    def partition_filters(route: Dict) -> List[Optional[Dict]]:
+        """Metadata filters to try in order, narrowest partition first, ending unfiltered"""
+        candidates = []
+        if route.get(SCHEME) and route.get(DOC_TYPE):
+            candidates.append({SCHEME: route[SCHEME], DOC_TYPE: route[DOC_TYPE]})
+        if route.get(SCHEME):
+            candidates.append({SCHEME: route[SCHEME]})
+        if route.get(DOC_TYPE):
+            candidates.append({DOC_TYPE: route[DOC_TYPE]})
+        candidates.append(None)
+        return candidates
+
+
+def routed_search(store, query: str, route: Dict, k: int = config.TOP_K_RESULTS,
+                  trace: Optional[Dict] = None) -> List:
+    """Ranked chunks for a routed query: narrowest partition first, widened while too few or weak
+
+    The search stays in a partition that returns k chunks led by a decisive keyword match or a
+    vector match of at least ROUTE_MIN_SIMILARITY. Otherwise the next wider partition is searched
+    too and the rankings are fused, so the partition's own hits lead. The query embedding is
+    cached, so a widening step repeats only the lookups.
+    """
+    # Imported here so the answer-catalog / 304 paths can route without loading langchain
+    from lexical_index import reciprocal_rank_fusion
+
+    rankings, paths = [], []
+    for filters in QueryRouter.partition_filters(route):
+        step = {}
+        ranking = store.search(query, k=k, filters=filters, trace=step)
+        paths.append(step.get('path'))
+        if ranking:
+            rankings.append(ranking)
+        strong = step.get('path') == 'lexical' or step.get('score', 0.0) >= config.ROUTE_MIN_SIMILARITY
+        if len(ranking) >= k and strong:
+            break
+
+    if trace is not None:
+        trace['path'] = 'lexical' if all(path == 'lexical' for path in paths) else 'hybrid'
+    if len(rankings) == 1:
+        return rankings[0]
+    return reciprocal_rank_fusion(rankings)
+
+
+def source_key_for_url(url: str) -> Optional[str]:
+    """Map a scraped URL back to its key in config.SOURCE_URLS"""
+    for key, source_url in config.SOURCE_URLS.items():
+        if source_url == url:
+            return key
+    return None
+
+
+def partition_tags(url: str, title: str = '', parent_url: str = '') -> Dict[str, str]:
+    """Scheme and document-type tags stored on every chunk at ingest
+
+    Chroma metadata cannot hold None, so missing tags are empty strings.
+    """
+    source_key = source_key_for_url(url) or ''
+    scheme = config.SOURCE_SCHEMES.get(source_key)
+    doc_type = config.SOURCE_DOC_TYPES.get(source_key)
+    if not source_key:
+        # Pages outside SOURCE_URLS (e.g. linked documents) are tagged from their title,
+        # falling back to the document type of the page that links to them
+        route = get_router().route(title) if title else {SCHEME: None, DOC_TYPE: None}
+        scheme = route[SCHEME]
+        doc_type = route[DOC_TYPE] or config.SOURCE_DOC_TYPES.get(source_key_for_url(parent_url) or '')
+    return {
+        'source_key': source_key,
+        SCHEME: scheme or '',
+        DOC_TYPE: doc_type or config.DEFAULT_DOC_TYPE,
+    }
+
+
+_default_router = None
+
+
+def get_router() -> QueryRouter:
+    """Shared router built from config (compiled once per process)"""
+    global _default_router
+    if _default_router is None:
+        _default_router = QueryRouter()
+    return _default_router
@@ -3,18 +3,38 @@ RAG pipeline for generating factual responses with citations
 """
 import os
 from langchain_openai import ChatOpenAI
+from langchain_community.embeddings import OpenAIEmbeddings
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage, SystemMessage
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import logging
+import time
 import config
-from vector_store import VectorStore
+from vector_store import VectorStore, documents_to_sources
+from sharding import ShardedVectorStore
 from datetime import datetime
 from data_collector import DataCollector
+from query_router import get_router, routed_search
+from query_log import log_query
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """You are a Facts-Only Mutual Fund AI Assistant. Your role is to answer factual questions about mutual fund schemes using ONLY the information provided in the context.
+
+Rules:
+1. Answer ONLY factual questions (expense ratio, exit load, minimum SIP, lock-in period, riskometer, benchmark, statement downloads, NAV, fund details)
+2. Keep answers concise (maximum 3 sentences, preferably 1-2)
+3. Base your answer ONLY on the provided context
+4. If the context doesn't contain the answer, respond: "I couldn't find specific information about [topic] in the official sources. Please check the official AMC website or contact the fund house directly."
+5. Never provide investment advice, recommendations, or opinions
+6. Never compare funds or make performance predictions
+7. Extract exact numbers, percentages, and dates from the context when available
+8. Do not include "Source:" in your response - it will be added automatically
+
+Format your response as:
+[Concise factual answer in 1-3 sentences with specific numbers/percentages if available]"""
+
 class RAGPipeline:
     """RAG pipeline for answering factual questions"""
     
@@ -24,9 +44,23 @@ class RAGPipeline:
             temperature=config.TEMPERATURE,
             max_tokens=config.MAX_TOKENS
         )
-        self.vector_store = VectorStore()
+        self.vector_store = ShardedVectorStore() if config.ENABLE_SHARDING else VectorStore()
+        self.router = get_router()
         self._ensure_vector_store()
 
+    def use_http_client(self, http_client):
+        """Route LLM and query-embedding calls through a shared (keep-alive) HTTP client"""
+        self.llm = ChatOpenAI(
+            model=config.LLM_MODEL,
+            temperature=config.TEMPERATURE,
+            max_tokens=config.MAX_TOKENS,
+            http_client=http_client
+        )
+        self.vector_store.embeddings = OpenAIEmbeddings(
+            model=config.EMBEDDING_MODEL,
+            http_client=http_client
+        )
+
     def _ensure_vector_store(self):
         """Ensure the vector store is available; build if missing."""
         try:
@@ -41,59 +75,62 @@ class RAGPipeline:
             self.vector_store.build_vector_store(documents, recreate=True)
             self.vector_store.load_vector_store()
         
+        # Compressed codes / ANN lists are served from the mmapped index; full vectors stay on disk
+        if config.EMBEDDING_QUANTIZATION or config.ANN_INDEX:
+            self.vector_store.use_shared_index()
+        
     def is_advice_request(self, query: str) -> bool:
         """Check if query is asking for investment advice"""
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in config.ADVICE_KEYWORDS)
+        return self.router.route(query)['is_advice']
     
-    def generate_response(self, query: str) -> Dict:
-        """Generate response with citation"""
+    def _retrieve(self, query: str, trace: Optional[Dict] = None) -> Tuple[Optional[Dict], List[Dict]]:
+        """Route and search; returns a final response for advice / no-result queries
+        
+        `trace['path']` is set to the serving path ('advice', 'no_results', 'lexical' or 'hybrid').
+        """
+        trace = trace if trace is not None else {}
+        
+        # One pass over the query finds advice intent, scheme and document type
+        route = self.router.route(query)
         
         # Check for advice requests
-        if self.is_advice_request(query):
+        if route['is_advice']:
+            trace['path'] = 'advice'
             return {
                 'answer': config.ADVICE_REFUSAL_MESSAGE,
                 'source': 'https://www.amfiindia.com/investor-corner/knowledge-center/faqs',
                 'is_advice': True
-            }
+            }, []
         
-        # Search vector store
-        search_results = self.vector_store.search_with_sources(query)
+        # Search the narrowest matching partition first, widening while results are too few or weak
+        search_results = documents_to_sources(routed_search(self.vector_store, query, route, trace=trace))
         
         if not search_results:
+            trace['path'] = 'no_results'
             return {
                 'answer': "I couldn't find specific information about your query in the official sources. Please try rephrasing your question or check the official AMC website.",
                 'source': config.SOURCE_URLS.get('nippon_main', 'https://mf.nipponindiaim.com/'),
-                'is_advice': False
-            }
+                'is_advice': False,
+                'is_no_result': True
+            }, []
         
+        return None, search_results
+    
+    @staticmethod
+    def build_messages(query: str, search_results: List[Dict], context_chars: int = config.CONTEXT_CHARS,
+                       k: int = config.TOP_K_RESULTS) -> Tuple[List, str]:
+        """LLM messages for a query and its top k search results, plus the primary source URL"""
         # Prepare context from search results
         context_parts = []
         sources = []
         
-        for result in search_results[:3]:  # Use top 3 results
-            context_parts.append(f"Source: {result['title']}\nContent: {result['content'][:500]}")
+        for result in search_results[:k]:
+            context_parts.append(f"Source: {result['title']}\nContent: {result['content'][:context_chars]}")
             sources.append(result['source'])
         
         context = "\n\n".join(context_parts)
         primary_source = sources[0] if sources else config.SOURCE_URLS.get('nippon_main', 'https://mf.nipponindiaim.com/')
         
-        # Create prompt
-        system_prompt = """You are a Facts-Only Mutual Fund AI Assistant. Your role is to answer factual questions about mutual fund schemes using ONLY the information provided in the context.
-
-Rules:
-1. Answer ONLY factual questions (expense ratio, exit load, minimum SIP, lock-in period, riskometer, benchmark, statement downloads, NAV, fund details)
-2. Keep answers concise (maximum 3 sentences, preferably 1-2)
-3. Base your answer ONLY on the provided context
-4. If the context doesn't contain the answer, respond: "I couldn't find specific information about [topic] in the official sources. Please check the official AMC website or contact the fund house directly."
-5. Never provide investment advice, recommendations, or opinions
-6. Never compare funds or make performance predictions
-7. Extract exact numbers, percentages, and dates from the context when available
-8. Do not include "Source:" in your response - it will be added automatically
-
-Format your response as:
-[Concise factual answer in 1-3 sentences with specific numbers/percentages if available]"""
-
         human_prompt = f"""Context from official sources:
 {context}
 
@@ -101,37 +138,83 @@ Question: {query}
 
 Provide a factual answer based on the context above. If the answer is not in the context, say so."""
 
+        messages = [
+            SystemMessage(content=SYSTEM_PROMPT),
+            HumanMessage(content=human_prompt)
+        ]
+        return messages, primary_source
+    
+    def _format_answer(self, content: str, primary_source: str) -> Dict:
+        """Attach source and timestamp to the LLM's answer"""
+        answer = content.strip()
+        
+        # Remove any existing "Source:" mentions from LLM response
+        answer = answer.split("Source:")[0].strip()
+        
+        # Add source and timestamp
+        answer += f"\n\nSource: {primary_source}"
+        last_updated = datetime.now().strftime("%Y-%m-%d")
+        answer += f"\n\nLast updated from sources: {last_updated}"
+        
+        return {
+            'answer': answer,
+            'source': primary_source,
+            'is_advice': False
+        }
+    
+    def _error_response(self, primary_source: str) -> Dict:
+        return {
+            'answer': "I encountered an error while processing your query. Please try again or check the official sources directly.",
+            'source': primary_source,
+            'is_advice': False,
+            'is_error': True
+        }
+    
+    def generate_response(self, query: str) -> Dict:
+        """Generate response with citation"""
+        start = time.perf_counter()
+        trace = {}
+        response = self._generate_response(query, trace)
+        log_query(query, 'error' if response.get('is_error') else trace.get('path', 'unknown'),
+                  (time.perf_counter() - start) * 1000, response.get('source'))
+        return response
+    
+    def _generate_response(self, query: str, trace: Dict) -> Dict:
+        early_response, search_results = self._retrieve(query, trace)
+        if early_response is not None:
+            return early_response
+        
+        messages, primary_source = self.build_messages(query, search_results)
         try:
             # Generate response
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=human_prompt)
-            ]
-            
             response = self.llm.invoke(messages)
-            answer = response.content.strip()
-            
-            # Remove any existing "Source:" mentions from LLM response
-            answer = answer.split("Source:")[0].strip()
-            
-            # Add source and timestamp
-            answer += f"\n\nSource: {primary_source}"
-            last_updated = datetime.now().strftime("%Y-%m-%d")
-            answer += f"\n\nLast updated from sources: {last_updated}"
-            
-            return {
-                'answer': answer,
-                'source': primary_source,
-                'is_advice': False
-            }
+            return self._format_answer(response.content, primary_source)
             
         except Exception as e:
             logger.error(f"Error generating response: {e}")
-            return {
-                'answer': "I encountered an error while processing your query. Please try again or check the official sources directly.",
-                'source': primary_source,
-                'is_advice': False
-            }
+            return self._error_response(primary_source)
+    
+    def generate_responses(self, queries: List[str]) -> List[Dict]:
+        """Answer many queries, sending all LLM calls as one concurrent batch"""
+        responses: List[Optional[Dict]] = []
+        pending = []
+        
+        for query in queries:
+            early_response, search_results = self._retrieve(query)
+            responses.append(early_response)
+            if early_response is None:
+                pending.append((len(responses) - 1, *self.build_messages(query, search_results)))
+        
+        if pending:
+            outputs = self.llm.batch([messages for _, messages, _ in pending], return_exceptions=True)
+            for (position, _, primary_source), output in zip(pending, outputs):
+                if isinstance(output, Exception):
+                    logger.error(f"Error generating response for '{queries[position]}': {output}")
+                    responses[position] = self._error_response(primary_source)
+                else:
+                    responses[position] = self._format_answer(output.content, primary_source)
+        
+        return responses
 
 if __name__ == "__main__":
     # Test the pipeline
@@ -0,0 +1,287 @@
+"""
+Adaptive refresh scheduler: re-fetch each source on its own interval and re-index only what changed
+
+Usage:
+    python refresh_scheduler.py --once              # one cron tick: check the due sources
+    python refresh_scheduler.py --daemon            # keep running, sleeping until the next source is due
+    python refresh_scheduler.py --status            # show per-source intervals and change history
+    python refresh_scheduler.py --once --force nav_dividends kim
+
+A source's interval shrinks (REFRESH_SPEEDUP) each time a check finds new content
+and grows (REFRESH_BACKOFF) each time it does not, within REFRESH_MIN/MAX_INTERVAL.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import config
+from data_collector import DataCollector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def content_hash(page: Dict) -> str:
+    """Hash of the parts of a scraped page that end up in the index"""
+    text = f"{page.get('title', '')}\n{page.get('content', '')}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _clamp_interval(seconds: float) -> float:
+    return max(config.REFRESH_MIN_INTERVAL, min(config.REFRESH_MAX_INTERVAL, seconds))
+
+
+class RefreshScheduler:
+    """Tracks per-source change history and refreshes the sources that are due"""
+
+    def __init__(self, state_file: Path = config.REFRESH_STATE_FILE):
+        self.state_file = Path(state_file)
+        self.collector = DataCollector()
+        self.state: Dict[str, Dict] = self._load_state()
+        self._local = threading.local()
+
+    def _load_state(self) -> Dict[str, Dict]:
+        state = {}
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read refresh state, starting fresh: {e}")
+
+        # New sources are due immediately, seeded with their known (or default) interval
+        for source_name, url in config.SOURCE_URLS.items():
+            entry = state.setdefault(source_name, {
+                'interval': config.REFRESH_INITIAL_INTERVALS.get(source_name, config.REFRESH_DEFAULT_INTERVAL),
+                'next_due': 0,
+                'content_hash': self._scraped_hash(source_name),
+                'last_checked': None,
+                'last_changed': None,
+                'checks': 0,
+                'changes': 0,
+                'failures': 0,
+                'history': []
+            })
+            entry['url'] = url
+        return {name: entry for name, entry in state.items() if name in config.SOURCE_URLS}
+
+    def _scraped_hash(self, source_name: str) -> Optional[str]:
+        """Hash of the page saved by an earlier full collection, if any"""
+        path = config.SCRAPED_DATA_DIR / f"{source_name}.json"
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return content_hash(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def save_state(self):
+        tmp_path = self.state_file.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        tmp_path.replace(self.state_file)
+
+    def due_sources(self, now: Optional[float] = None) -> List[str]:
+        now = now or time.time()
+        return [name for name, entry in self.state.items() if entry['next_due'] <= now]
+
+    def seconds_until_due(self) -> float:
+        return max(0.0, min(entry['next_due'] for entry in self.state.values()) - time.time())
+
+    def _collector(self) -> DataCollector:
+        """One collector (HTTP session) per fetch thread"""
+        if not hasattr(self._local, 'collector'):
+            self._local.collector = DataCollector()
+        return self._local.collector
+
+    def _fetch_host(self, source_names: List[str]) -> Dict[str, Optional[Dict]]:
+        """Fetch one host's due sources sequentially, politely spaced"""
+        pages = {}
+        for i, source_name in enumerate(source_names):
+            if i:
+                time.sleep(config.REFRESH_POLITENESS_DELAY)
+            pages[source_name] = self._collector().fetch_page(self.state[source_name]['url'])
+        return pages
+
+    def fetch(self, source_names: List[str]) -> Dict[str, Optional[Dict]]:
+        """Fetch sources in parallel across hosts (None for failed fetches)"""
+        by_host: Dict[str, List[str]] = {}
+        for source_name in source_names:
+            by_host.setdefault(urlparse(self.state[source_name]['url']).netloc, []).append(source_name)
+
+        pages: Dict[str, Optional[Dict]] = {}
+        with ThreadPoolExecutor(max_workers=config.REFRESH_WORKERS, thread_name_prefix="refresh") as pool:
+            for host_pages in pool.map(self._fetch_host, by_host.values()):
+                pages.update(host_pages)
+        return pages
+
+    def _record(self, source_name: str, page: Optional[Dict], now: float) -> bool:
+        """Update a source's schedule after a check; returns whether its content changed"""
+        entry = self.state[source_name]
+        entry['last_checked'] = now
+
+        if page is None:
+            entry['failures'] += 1
+            retry = config.REFRESH_RETRY_DELAY * 2 ** (entry['failures'] - 1)
+            entry['next_due'] = now + min(retry, entry['interval'])
+            return False
+
+        entry['failures'] = 0
+        entry['checks'] += 1
+        new_hash = content_hash(page)
+        changed = new_hash != entry['content_hash']
+        if changed and entry['content_hash'] is None:
+            # First sighting (never scraped before): index it, but it says nothing about change rate
+            entry['content_hash'] = new_hash
+        elif changed:
+            entry['content_hash'] = new_hash
+            entry['last_changed'] = now
+            entry['changes'] += 1
+            entry['history'] = (entry['history'] + [now])[-config.REFRESH_HISTORY_LENGTH:]
+            entry['interval'] = _clamp_interval(entry['interval'] * config.REFRESH_SPEEDUP)
+        else:
+            entry['interval'] = _clamp_interval(entry['interval'] * config.REFRESH_BACKOFF)
+        entry['next_due'] = now + entry['interval']
+        return changed
+
+    def tick(self, force: Optional[List[str]] = None) -> List[str]:
+        """Check every due (or forced) source once and re-index the changed ones"""
+        now = time.time()
+        source_names = sorted(set(self.due_sources(now)) | set(force or []))
+        if not source_names:
+            logger.info(f"No sources due; next check in {self.seconds_until_due():.0f}s")
+            return []
+
+        logger.info(f"Checking {len(source_names)} source(s): {', '.join(source_names)}")
+        pages = self.fetch(source_names)
+
+        changed = [name for name in source_names if self._record(name, pages.get(name), now)]
+        if changed:
+            try:
+                self._reindex({name: pages[name] for name in changed})
+            except Exception:
+                # Forget this check so the changed sources are detected (and re-indexed) again
+                self.state = self._load_state()
+                raise
+            for name in changed:
+                self.collector.save_source(name, pages[name])
+        self.save_state()
+        if changed and config.WARM_AFTER_REFRESH:
+            self._warm_caches()
+
+        logger.info(f"{len(changed)} of {len(source_names)} checked source(s) changed"
+                    + (f": {', '.join(changed)}" if changed else ""))
+        return changed
+
+    def _reindex(self, pages: Dict[str, Dict]):
+        """Merge changed pages into the combined scrape and re-embed just the chunks that changed"""
+        # Replace changed pages in place: boilerplate ownership and near-duplicate canonicals go to
+        # the first page in order, so moving a page would move text between pages on every refresh
+        replacements = {page['url']: page for page in pages.values()}
+        all_data = [replacements.pop(item.get('url'), item) for item in self.collector.load_scraped_data()]
+        all_data.extend(replacements.values())
+        self.collector.save_combined(all_data)
+
+        if config.ENABLE_SHARDING:
+            from sharding import ShardedVectorStore
+            store = ShardedVectorStore()
+        else:
+            from vector_store import VectorStore
+            store = VectorStore()
+
+        try:
+            store.load_vector_store()
+        except Exception:
+            logger.info("No vector store yet; building it from all scraped sources")
+            store.build_vector_store(store.create_documents_from_data(all_data), recreate=True)
+            self._refresh_pdfs(store, list(pages), rebuilt=True)
+            return
+        # Dedup needs the whole corpus (boilerplate spans pages, collapsed chunks stand for several)
+        store.refresh_sources(all_data)
+        self._refresh_pdfs(store, list(pages))
+    
+    def _refresh_pdfs(self, store, source_names: List[str], rebuilt: bool = False):
+        """Follow the PDFs linked from changed KIM / SID / addenda pages (only changed PDFs are re-indexed)"""
+        from pdf_collector import PDFCollector
+        
+        pdf_collector = PDFCollector()
+        if rebuilt:
+            pdf_collector.force_index(store)
+        pdf_sources = [name for name in source_names if name in config.PDF_SOURCE_KEYS]
+        if pdf_sources:
+            pdf_collector.run(pdf_collector.discover(pdf_sources), store=store)
+
+    def _warm_caches(self):
+        """Rebuild the answer catalog and query embeddings for the logged hot set"""
+        from query_log import hot_queries, read_entries, warm
+
+        try:
+            warm(hot_queries(list(read_entries())))
+        except Exception as e:
+            logger.error(f"Cache warming after refresh failed: {e}")
+
+    def run_daemon(self):
+        """Tick whenever a source falls due until SIGTERM/SIGINT"""
+        stop = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: stop.set())
+
+        logger.info("Refresh daemon started")
+        while not stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Refresh tick failed: {e}")
+            stop.wait(min(self.seconds_until_due(), config.REFRESH_DAEMON_MAX_SLEEP) or 1)
+        logger.info("Refresh daemon stopped")
+
+    def status(self) -> List[Dict]:
+        """Per-source schedule and observed change rate"""
+        rows = []
+        for name, entry in sorted(self.state.items(), key=lambda item: item[1]['next_due']):
+            history = entry['history']
+            gaps = [b - a for a, b in zip(history, history[1:])]
+            rows.append({
+                'source': name,
+                'interval_h': entry['interval'] / 3600,
+                'next_due': datetime.fromtimestamp(entry['next_due']).strftime('%Y-%m-%d %H:%M') if entry['next_due'] else 'now',
+                'checks': entry['checks'],
+                'changes': entry['changes'],
+                'mean_change_gap_h': sum(gaps) / len(gaps) / 3600 if gaps else None,
+                'failures': entry['failures']
+            })
+        return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh sources on adaptive, per-source intervals")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--once", action="store_true", help="check due sources once and exit (for cron)")
+    mode.add_argument("--daemon", action="store_true", help="keep running and check sources as they fall due")
+    mode.add_argument("--status", action="store_true", help="print the schedule and exit")
+    parser.add_argument("--force", nargs="+", default=[], metavar="SOURCE",
+                        help="check these sources now even if they are not due")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.force if name not in config.SOURCE_URLS]
+    if unknown:
+        parser.error(f"Unknown source(s): {', '.join(unknown)}")
+
+    scheduler = RefreshScheduler()
+    if args.status:
+        print(f"{'source':<20} {'interval h':>10} {'next due':>17} {'checks':>6} {'changes':>7} {'gap h':>7} {'fails':>5}")
+        for row in scheduler.status():
+            gap = f"{row['mean_change_gap_h']:7.1f}" if row['mean_change_gap_h'] is not None else f"{'-':>7}"
+            print(f"{row['source']:<20} {row['interval_h']:10.1f} {row['next_due']:>17} "
+                  f"{row['checks']:>6} {row['changes']:>7} {gap} {row['failures']:>5}")
+    elif args.daemon:
+        scheduler.run_daemon()
+    else:
+        scheduler.tick(force=args.force)
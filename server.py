@@ -0,0 +1,305 @@
+"""
+Long-running ASGI server mode: one pre-loaded RAG pipeline shared by forked workers
+
+Usage:
+    python server.py [--host 0.0.0.0] [--port 8000] [--workers 2]
+
+The master process loads RAGPipeline and maps the embedding index once, then
+forks the workers, so the index pages are shared rather than copied per worker.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+import config
+from http_cache import CACHE_POLICIES, cache_headers, compress, etag_matches, not_modified_response, query_etag
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type"
+}
+
+QUERY_PATHS = {"/query", "/api/query"}
+
+
+class QueryServer:
+    """Minimal ASGI application exposing the pipeline plus health and readiness probes"""
+
+    def __init__(self, pipeline, index_version: Optional[str] = None):
+        self.pipeline = pipeline
+        # Version of the index the pipeline loaded; the server never reloads it, so ETags
+        # must not follow a newer index on disk that these answers do not come from
+        self.index_version = index_version
+        self.ready = False
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._slots = asyncio.Semaphore(config.SERVER_MAX_CONCURRENCY)
+                self.ready = self.pipeline is not None
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Connections are already drained here; readiness was failed by the signal handler
+                self.ready = False
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        method = scope["method"]
+        path = scope["path"].rstrip("/") or "/"
+
+        if method == "OPTIONS":
+            await self._respond(send, 200, None)
+        elif path == "/healthz":
+            await self._respond(send, 200, {"status": "ok"})
+        elif path == "/readyz":
+            if self.ready:
+                await self._respond(send, 200, {"status": "ready"})
+            else:
+                await self._respond(send, 503, {"status": "not ready"})
+        elif path in QUERY_PATHS and method in ("GET", "POST"):
+            await self._query(scope, receive, send)
+        else:
+            await self._respond(send, 404, {"error": "Not found"})
+
+    async def _query(self, scope, receive, send):
+        request_headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                           for name, value in scope.get("headers", [])}
+        accept_encoding = request_headers.get("accept-encoding")
+        if scope["method"] == "GET":
+            params = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+            query = params.get("q", [""])[0]
+        else:
+            try:
+                body = json.loads(await self._read_body(receive) or b"{}")
+                query = body.get("query", "") if body else ""
+            except (ValueError, AttributeError):
+                query = ""
+
+        if not query:
+            await self._respond(send, 400, {"error": "Query parameter is required"})
+            return
+
+        # GET answers are cacheable: the ETag only changes with the question or the index
+        etag = query_etag(query, index_version=self.index_version) if scope["method"] == "GET" else None
+        if etag and etag_matches(request_headers.get("if-none-match"), etag):
+            await self._respond(send, 304, None, not_modified_response(query, {}, etag)["headers"])
+            return
+        if not self.ready:
+            await self._respond(send, 503, {"error": "Server is not ready"})
+            return
+
+        try:
+            # The pipeline is synchronous; run it off the event loop, bounded per worker
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(None, self.pipeline.generate_response, query)
+        except Exception as e:
+            logger.error(f"Error handling query: {e}")
+            await self._respond(send, 500, {"error": str(e)}, accept_encoding=accept_encoding)
+            return
+
+        payload = {
+            "answer": response["answer"],
+            "source": response["source"],
+            "is_advice": response.get("is_advice", False)
+        }
+        extra_headers = cache_headers(200, payload, etag, response.get("is_error", False))
+        await self._respond(send, 200, payload, extra_headers, accept_encoding)
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def _respond(send, status: int, payload: Optional[Dict],
+                       extra_headers: Optional[Dict[str, str]] = None, accept_encoding: Optional[str] = None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        body, encoding = compress(body, accept_encoding)
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        if encoding:
+            headers.append((b"content-encoding", encoding.encode()))
+        all_headers = {**CORS_HEADERS, **(extra_headers or {})}
+        if status >= 400:
+            # Errors (including 503 while not ready) must never be cached
+            all_headers.setdefault("Cache-Control", CACHE_POLICIES["error"])
+        if encoding:
+            all_headers.setdefault("Vary", "Accept-Encoding")
+        headers.extend((name.lower().encode(), value.encode()) for name, value in all_headers.items())
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def load_pipeline() -> Tuple[object, str]:
+    """Load the pipeline and map the shared embedding index (run once, before forking)
+
+    Returns the pipeline and the version of the index it loaded.
+    """
+    from rag_pipeline import RAGPipeline
+
+    pipeline = RAGPipeline()
+    pipeline.vector_store.use_shared_index()
+    index_version = pipeline.vector_store.index_version
+    # Move everything loaded so far out of the collector's reach, so refcount/GC
+    # bookkeeping in workers does not copy-on-write the shared pages
+    gc.collect()
+    gc.freeze()
+    return pipeline, index_version
+
+
+def _pooled_http_client():
+    """Keep-alive connection pool for LLM and embedding calls (one per worker)"""
+    import httpx
+
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=config.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=config.LLM_POOL_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    )
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(pipeline, sock: socket.socket, index_version: Optional[str] = None):
+    """Serve requests on an already-bound socket until SIGTERM/SIGINT"""
+    import uvicorn
+
+    # Connection pools must not cross a fork, so each worker opens its own
+    http_client = _pooled_http_client()
+    pipeline.use_http_client(http_client)
+
+    app = QueryServer(pipeline, index_version)
+    server = uvicorn.Server(uvicorn.Config(
+        app,
+        lifespan="on",
+        timeout_keep_alive=config.SERVER_KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=config.SERVER_GRACEFUL_TIMEOUT,
+        access_log=False
+    ))
+
+    # Fail readiness as soon as SIGTERM arrives, before uvicorn drains in-flight requests;
+    # lifespan shutdown only runs after draining has finished
+    handle_exit = server.handle_exit
+
+    def drain(sig, frame):
+        app.ready = False
+        handle_exit(sig, frame)
+
+    server.handle_exit = drain
+    try:
+        server.run(sockets=[sock])
+    finally:
+        http_client.close()
+
+
+def serve(host: str = config.SERVER_HOST, port: int = config.SERVER_PORT,
+          workers: int = config.SERVER_WORKERS):
+    """Load once, fork `workers` processes and supervise them until told to stop"""
+    pipeline, index_version = load_pipeline()
+    sock = _bind_socket(host, port)
+    logger.info(f"Listening on http://{host}:{port} with {workers} worker(s)")
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        run_worker(pipeline, sock, index_version)
+        return
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                run_worker(pipeline, sock, index_version)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            logger.info("Shutting down workers")
+            stopping = True
+            for pid in list(children):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    deadline = None
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            children.discard(pid)
+            if not stopping:
+                logger.warning(f"Worker {pid} exited with status {status}; restarting")
+                spawn()
+            continue
+
+        if stopping:
+            deadline = deadline or time.monotonic() + config.SERVER_GRACEFUL_TIMEOUT + 5
+            if time.monotonic() > deadline:
+                for pid in list(children):
+                    logger.warning(f"Worker {pid} did not stop in time; killing")
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+        time.sleep(0.2)
+
+    sock.close()
+    logger.info("Server stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Mutual Fund Facts Assistant API server")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
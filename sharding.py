@@ -0,0 +1,271 @@
+"""
+Sharded vector stores (one collection per AMC / source family) with parallel fan-out search
+
+Usage (rebuild shards independently from the scraped data; all shards if none given):
+    python sharding.py [shard ...]
+"""
+import hashlib
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+from langchain.schema import Document
+import config
+from lexical_index import BM25Index
+from query_router import partition_tags, source_key_for_url
+from utils import read_index_info, read_index_version, write_index_version
+from vector_store import VectorStore, documents_to_sources, fuse_results
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def shard_for_url(url: str) -> str:
+    """Shard a page belongs to: by its SOURCE_URLS key, else by host, else the first shard"""
+    source_key = source_key_for_url(url)
+    for shard, source_keys in config.SHARDS.items():
+        if source_key in source_keys:
+            return shard
+
+    # Pages outside SOURCE_URLS (e.g. linked documents) follow their site's shard
+    host = urlparse(url).netloc
+    for shard, source_keys in config.SHARDS.items():
+        if any(urlparse(config.SOURCE_URLS.get(key, '')).netloc == host for key in source_keys):
+            return shard
+    return next(iter(config.SHARDS))
+
+
+def shards_for_filters(filters: Optional[Dict]) -> List[str]:
+    """Shards holding at least one source in the requested partition (all if none match)"""
+    if not filters:
+        return list(config.SHARDS)
+    selected = []
+    for shard, source_keys in config.SHARDS.items():
+        for key in source_keys:
+            tags = partition_tags(config.SOURCE_URLS.get(key, ''))
+            if all(tags.get(field) == value for field, value in filters.items()):
+                selected.append(shard)
+                break
+    return selected or list(config.SHARDS)
+
+
+def shard_directory(name: str) -> Path:
+    """Where a shard's collection and index files live"""
+    return config.VECTOR_STORE_DIR / "shards" / name
+
+
+def _merge(per_shard: List[List[Tuple[Document, float]]], k: int) -> List[Tuple[Document, float]]:
+    """Global top-k of per-shard (document, score) lists"""
+    merged = [hit for hits in per_shard for hit in hits]
+    merged.sort(key=lambda hit: hit[1], reverse=True)
+    return merged[:k]
+
+
+class ShardedVectorStore:
+    """Drop-in replacement for VectorStore that spreads the index over per-shard collections"""
+
+    def __init__(self, shard_names: Optional[List[str]] = None):
+        names = shard_names or list(config.SHARDS)
+        self.shards: Dict[str, VectorStore] = {
+            name: VectorStore(
+                collection_name=f"{config.COLLECTION_NAME}_{name}",
+                vector_store_path=shard_directory(name)
+            )
+            for name in names
+        }
+        self.loaded: List[str] = []
+        self.dedup_stats: Dict[str, Dict] = {}
+        self._executor = None
+
+    @property
+    def embeddings(self):
+        return next(iter(self.shards.values())).embeddings
+
+    @embeddings.setter
+    def embeddings(self, embeddings):
+        for shard in self.shards.values():
+            shard.embeddings = embeddings
+
+    def split_by_shard(self, data: List[Dict]) -> Dict[str, List[Dict]]:
+        """Group scraped pages by the shard they belong to"""
+        grouped: Dict[str, List[Dict]] = {name: [] for name in self.shards}
+        for item in data:
+            shard = shard_for_url(item.get('url', ''))
+            if shard in grouped:
+                grouped[shard].append(item)
+        return grouped
+
+    def _shard_documents(self, name: str, data: List[Dict]) -> List[Document]:
+        documents = self.shards[name].create_documents_from_data(data) if data else []
+        for doc in documents:
+            doc.metadata['shard'] = name
+        self.dedup_stats[name] = self.shards[name].dedup_stats
+        return documents
+
+    def iter_documents_from_data(self, data: Iterable[Dict]) -> Iterator[Document]:
+        """Stream chunk documents (all shards chunk alike), each tagged with its shard"""
+        for doc in next(iter(self.shards.values())).iter_documents_from_data(data):
+            doc.metadata['shard'] = shard_for_url(doc.metadata.get('source', ''))
+            yield doc
+
+    def create_documents_from_data(self, data: List[Dict]) -> List[Document]:
+        """Chunk (and deduplicate) each shard's pages separately, tagging chunks with their shard"""
+        documents = []
+        for name, items in self.split_by_shard(data).items():
+            documents.extend(self._shard_documents(name, items))
+        return documents
+
+    def build_vector_store(self, documents: List[Document], recreate: bool = False):
+        """Build every shard that has documents"""
+        grouped: Dict[str, List[Document]] = {}
+        for doc in documents:
+            grouped.setdefault(doc.metadata.get('shard', ''), []).append(doc)
+        for name, shard_documents in grouped.items():
+            if name in self.shards:
+                self.shards[name].build_vector_store(shard_documents, recreate=recreate)
+        self._write_index_version()
+
+    def build_shard(self, name: str, data: List[Dict], recreate: bool = True):
+        """Rebuild one shard from its pages without touching the others"""
+        documents = self._shard_documents(name, data)
+        if not documents:
+            logger.warning(f"No documents for shard '{name}'; leaving it unchanged")
+            return
+        self.shards[name].build_vector_store(documents, recreate=recreate)
+        if name not in self.loaded:
+            self.loaded.append(name)
+        self._write_index_version()
+
+    def refresh_sources(self, all_data: List[Dict]):
+        """Re-index after some pages were re-scraped; `all_data` is the whole scraped corpus
+
+        Each shard is chunked and deduplicated as in a full build; only changed chunks are embedded.
+        """
+        for name, items in self.split_by_shard(all_data).items():
+            if items:
+                self.shards[name].replace_documents([item.get('url', '') for item in items],
+                                                    self._shard_documents(name, items))
+        self._write_index_version()
+
+    def add_documents(self, documents: List[Document], defer: bool = False):
+        """Insert chunks into the shards their sources belong to (see VectorStore.add_documents for defer)"""
+        grouped: Dict[str, List[Document]] = {}
+        for doc in documents:
+            name = doc.metadata.get('shard') or shard_for_url(doc.metadata.get('source', ''))
+            doc.metadata['shard'] = name
+            grouped.setdefault(name, []).append(doc)
+        for name, shard_documents in grouped.items():
+            if name in self.shards:
+                self.shards[name].add_documents(shard_documents, defer=True)
+        if not defer:
+            self.flush_additions()
+
+    def flush_additions(self):
+        """Update every shard that received deferred chunks, then the combined version"""
+        for shard in self.shards.values():
+            shard.flush_additions()
+        self._write_index_version()
+
+    def remove_documents(self, values: List[str], field: str = 'source'):
+        """Drop matching chunks from every shard"""
+        if not self.loaded:
+            self.load_vector_store()
+        for name in self.loaded:
+            self.shards[name].remove_documents(values, field)
+        self._write_index_version()
+
+    def _write_index_version(self):
+        """Combined version of all shards, written at the top of VECTOR_STORE_DIR
+
+        Read from every configured shard's directory, not just the ones this instance opened,
+        so rebuilding one shard never reissues a version the others have moved past.
+        """
+        infos = {name: read_index_info(shard_directory(name)) for name in sorted(config.SHARDS)}
+        shard_versions = [f"{name}:{info.get('version', 'unversioned')}" for name, info in infos.items()]
+        version = hashlib.sha256('|'.join(shard_versions).encode('utf-8')).hexdigest()[:16]
+        write_index_version(config.VECTOR_STORE_DIR, version, sum(info.get('chunks', 0) for info in infos.values()))
+
+    @property
+    def index_version(self) -> str:
+        return read_index_version(config.VECTOR_STORE_DIR)
+
+    def load_vector_store(self):
+        """Load every built shard; fail only if none could be loaded"""
+        self.loaded = []
+        for name, shard in self.shards.items():
+            try:
+                shard.load_vector_store()
+                self.loaded.append(name)
+            except Exception as e:
+                logger.warning(f"Shard '{name}' unavailable: {e}")
+        if not self.loaded:
+            raise RuntimeError("No vector store shards could be loaded")
+        logger.info(f"Loaded shards: {', '.join(self.loaded)}")
+
+    def use_shared_index(self):
+        for name in self.loaded:
+            self.shards[name].use_shared_index()
+
+    def _fan_out(self, search: Callable[[VectorStore], List[Tuple[Document, float]]],
+                 names: List[str]) -> List[List[Tuple[Document, float]]]:
+        """Run a search on several shards in parallel"""
+        if len(names) == 1:
+            return [search(self.shards[names[0]])]
+        if self._executor is None:
+            # Created lazily so no threads exist before server workers fork
+            self._executor = ThreadPoolExecutor(
+                max_workers=config.SHARD_SEARCH_WORKERS, thread_name_prefix="shard-search"
+            )
+        return list(self._executor.map(search, [self.shards[name] for name in names]))
+
+    def search(self, query: str, k: int = config.TOP_K_RESULTS,
+               filters: Optional[Dict] = None, trace: Optional[Dict] = None) -> List[Document]:
+        """Fan out to the relevant shards and merge their top-k hits"""
+        if not self.loaded:
+            self.load_vector_store()
+        names = [name for name in shards_for_filters(filters) if name in self.loaded] or self.loaded
+
+        lexical_results = _merge(self._fan_out(lambda shard: shard.lexical_search(query, k, filters), names), k)
+        if BM25Index.is_decisive(lexical_results):
+            if trace is not None:
+                trace['path'] = 'lexical'
+                trace['score'] = lexical_results[0][1]
+            return [doc for doc, score in lexical_results]
+
+        if trace is not None:
+            trace['path'] = 'hybrid'
+        # Embed once and reuse the vector for every shard
+        query_embedding = self.shards[names[0]].embed_query(query)
+        vector_results = _merge(
+            self._fan_out(lambda shard: shard.vector_search(query_embedding, k, filters), names), k
+        )
+        if trace is not None:
+            trace['score'] = vector_results[0][1] if vector_results else 0.0
+        return fuse_results(lexical_results, vector_results, k)
+
+    def search_with_sources(self, query: str, k: int = config.TOP_K_RESULTS,
+                            filters: Optional[Dict] = None, trace: Optional[Dict] = None) -> List[Dict]:
+        """Search and return results with source URLs"""
+        return documents_to_sources(self.search(query, k, filters, trace))
+
+
+if __name__ == "__main__":
+    from data_collector import DataCollector
+
+    requested = sys.argv[1:] or list(config.SHARDS)
+    unknown = [name for name in requested if name not in config.SHARDS]
+    if unknown:
+        sys.exit(f"Unknown shard(s): {', '.join(unknown)}. Available: {', '.join(config.SHARDS)}")
+
+    collector = DataCollector()
+    data = collector.load_scraped_data()
+    if not data:
+        logger.info("No scraped data found. Collecting now...")
+        data = collector.collect_all_sources()
+
+    store = ShardedVectorStore(requested)
+    for name, items in store.split_by_shard(data).items():
+        logger.info(f"Building shard '{name}' from {len(items)} sources")
+        store.build_shard(name, items, recreate=True)
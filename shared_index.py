@@ -0,0 +1,194 @@
+"""
+Read-only, memory-mapped embedding index shared by all server worker processes
+"""
+import json
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+import config
+import ann_index
+import quantization
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _pair_lock(directory: Path, exclusive: bool):
+    """Serialize swapping the vectors + sidecar pair against workers opening it (no-op without fcntl)"""
+    if fcntl is None:
+        yield
+        return
+    with open(Path(directory) / (config.SHARED_EMBEDDINGS_FILE + '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SharedEmbeddingIndex:
+    """Cosine search over embeddings stored in a .npy file opened with mmap
+
+    Every process that opens the file maps the same pages from the OS page cache,
+    so N forked workers share one copy of the vectors instead of holding N.
+
+    With a quantizer, candidates come from a scan over compact int8/binary codes
+    held in memory and only the shortlisted full-precision rows are read from disk.
+    With an ANN index, candidates come from the closest IVF lists instead.
+    """
+
+    def __init__(self, embeddings: np.ndarray, documents: List[Document], quantizer=None, ann=None):
+        if len(embeddings) != len(documents):
+            raise ValueError(f"{len(embeddings)} embeddings for {len(documents)} documents")
+        self.embeddings = embeddings
+        self.documents = documents
+        self.quantizer = quantizer
+        self.ann = ann
+        self._masks: Dict[Tuple, np.ndarray] = {}
+
+    @staticmethod
+    def paths(directory: Path) -> Tuple[Path, Path]:
+        """Embedding matrix and document sidecar paths inside a vector store directory"""
+        return directory / config.SHARED_EMBEDDINGS_FILE, directory / config.SHARED_DOCUMENTS_FILE
+
+    @classmethod
+    def export(cls, directory: Path, embeddings: List[List[float]], documents: List[Document]):
+        """Write unit-normalized float32 vectors and their chunks to disk"""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(documents), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        cls._replace_pair(directory, matrix, [
+            {'page_content': doc.page_content, 'metadata': doc.metadata} for doc in documents
+        ])
+        quantization.remove_codes(directory)
+        ann_index.remove_index(directory)
+        logger.info(f"Exported {matrix.shape[0]} x {matrix.shape[1]} embeddings to {cls.paths(directory)[0]}")
+
+    @classmethod
+    def append(cls, directory: Path, embeddings: List[List[float]], documents: List[Document]):
+        """Add vectors after the exported ones; a saved ANN index picks them up incrementally"""
+        embeddings_path, documents_path = cls.paths(directory)
+        existing = np.load(embeddings_path, mmap_mode='r')
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(documents), existing.shape[1])
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        # Copy the old rows through a mapped output file in blocks: neither matrix is held in memory
+        tmp_embeddings = embeddings_path.with_suffix('.tmp.npy')
+        rows = existing.shape[0]
+        combined = np.lib.format.open_memmap(tmp_embeddings, mode='w+', dtype=np.float32,
+                                             shape=(rows + len(matrix), existing.shape[1]))
+        for start in range(0, rows, config.SHARED_APPEND_BLOCK_ROWS):
+            end = min(start + config.SHARED_APPEND_BLOCK_ROWS, rows)
+            combined[start:end] = existing[start:end]
+        combined[rows:] = matrix
+        combined.flush()
+        del combined, existing
+
+        with open(documents_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        stored.extend({'page_content': doc.page_content, 'metadata': doc.metadata} for doc in documents)
+        cls._install_pair(directory, tmp_embeddings, stored)
+        # Codes are cheap to re-encode; the IVF index is extended on next load instead
+        quantization.remove_codes(directory)
+        logger.info(f"Appended {len(documents)} embeddings to {cls.paths(directory)[0]}")
+
+    @classmethod
+    def _replace_pair(cls, directory: Path, matrix: np.ndarray, stored_documents: List[Dict]):
+        """Write vectors and sidecar to temp files, then swap both in under the pair lock
+
+        Running workers never map a half-written file, nor vectors from one export with
+        the documents of another.
+        """
+        tmp_embeddings = cls.paths(directory)[0].with_suffix('.tmp.npy')
+        np.save(tmp_embeddings, matrix)
+        cls._install_pair(directory, tmp_embeddings, stored_documents)
+
+    @classmethod
+    def _install_pair(cls, directory: Path, tmp_embeddings: Path, stored_documents: List[Dict]):
+        """Write the sidecar next to already written temp vectors and swap both in"""
+        embeddings_path, documents_path = cls.paths(directory)
+        tmp_documents = documents_path.with_suffix('.tmp.json')
+        with open(tmp_documents, 'w', encoding='utf-8') as f:
+            json.dump(stored_documents, f, ensure_ascii=False)
+        with _pair_lock(directory, exclusive=True):
+            tmp_embeddings.replace(embeddings_path)
+            tmp_documents.replace(documents_path)
+
+    @classmethod
+    def load(cls, directory: Path,
+             quantization_mode: Optional[str] = config.EMBEDDING_QUANTIZATION) -> 'SharedEmbeddingIndex':
+        """Open a previously exported index read-only, with codes for `quantization_mode`"""
+        embeddings_path, documents_path = cls.paths(directory)
+        # Open both halves of the pair together; the mapping keeps this export even if it is replaced
+        with _pair_lock(directory, exclusive=False):
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+            with open(documents_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        quantizer = None
+        if quantization_mode:
+            quantizer = quantization.load_or_build(directory, embeddings, quantization_mode)
+        ann = None
+        if config.ANN_INDEX == "ivf":
+            ann = ann_index.load_or_build(directory, embeddings)
+        documents = [
+            Document(page_content=item['page_content'], metadata=item.get('metadata', {}))
+            for item in stored
+        ]
+        logger.info(f"Mapped {len(documents)} embeddings from {embeddings_path}")
+        return cls(embeddings, documents, quantizer, ann)
+
+    def _mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """Boolean row mask for a metadata partition (cached per filter)"""
+        if not filters:
+            return None
+        key = tuple(sorted(filters.items()))
+        if key not in self._masks:
+            self._masks[key] = np.array([
+                all(doc.metadata.get(field) == value for field, value in filters.items())
+                for doc in self.documents
+            ], dtype=bool)
+        return self._masks[key]
+
+    def search(self, query_embedding: List[float], k: int = config.TOP_K_RESULTS,
+               filters: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Top-k (document, cosine similarity) pairs, best first"""
+        if not self.documents:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        mask = self._mask(filters)
+        if self.ann is not None:
+            top, exact = self.ann.search(self.embeddings, query, k, mask)
+            return [(self.documents[i], float(score)) for i, score in zip(top, exact)]
+
+        if self.quantizer is not None:
+            candidates = quantization.shortlist(
+                self.quantizer.scores(query), max(k, config.QUANTIZED_RERANK_CANDIDATES), mask
+            )
+            top, exact = quantization.rerank(self.embeddings, candidates, query, k)
+            return [(self.documents[i], float(score)) for i, score in zip(top, exact)]
+
+        scores = self.embeddings @ query
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.documents[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
@@ -94,6 +94,95 @@ def test_rag_pipeline():
         print("   This might be expected if data/vector store is not set up yet")
         return False
 
+def test_advice_routing():
+    """Test that the router refuses everything the original substring check refused"""
+    print("\nTesting advice routing...")
+    import config
+    from query_router import get_router
+    router = get_router()
+    queries = [
+        "Give me a recommendation for a fund", "What are your suggestions?", "Is this fund recommended?",
+        "I was thinking of switching", "Any opinions on small cap?", "Should I buy the ELSS fund?",
+        "Which is better, large cap or flexi cap?", "What is the exit load of Nippon India Flexi Cap Fund?",
+        "Where can I download my account statement?", "What is the lock-in period of an ELSS fund?"
+    ]
+    for query in queries:
+        expected = any(keyword in query.lower() for keyword in config.ADVICE_KEYWORDS)
+        assert router.route(query)['is_advice'] == expected, f"advice routing changed for: {query}"
+    print("✅ Advice keywords match as before (substring from a word start)")
+    return True
+
+def test_dedup_keeps_figures():
+    """Test that near-duplicate collapsing never merges chunks whose figures or schemes differ"""
+    print("\nTesting chunk deduplication...")
+    from langchain.schema import Document
+    from dedup import ChunkDeduplicator
+    template = ("Investors should read all scheme related documents carefully before investing. The "
+                "investment objective is to generate long term capital appreciation from a portfolio that "
+                "is predominantly invested in equity and equity related instruments. There is no assurance "
+                "that the investment objective of the scheme will be achieved. Mutual fund investments are "
+                "subject to market risks and past performance may or may not be sustained in future. "
+                "Units can be purchased through the website, the mobile application, registered distributors "
+                "or any of the official points of acceptance, and the applicable net asset value depends on "
+                "the time at which the application and the funds are received by the asset management company. "
+                "The total expense ratio is {} percent for the regular plan and {} percent for the direct plan.")
+    documents = [
+        Document(page_content=template.format('1.49', '0.64'),
+                 metadata={'source': 'https://example.com/large-cap', 'scheme': 'Large Cap', 'doc_type': 'scheme_page'}),
+        Document(page_content=template.format('1.78', '0.51'),
+                 metadata={'source': 'https://example.com/flexi-cap', 'scheme': 'Flexi Cap', 'doc_type': 'scheme_page'}),
+        Document(page_content=template.format('1.49', '0.64'),
+                 metadata={'source': 'https://example.com/large-cap#copy', 'scheme': 'Large Cap', 'doc_type': 'scheme_page'}),
+    ]
+    kept, removed = ChunkDeduplicator().collapse_near_duplicates(documents)
+    contents = ' '.join(doc.page_content for doc in kept)
+    assert '1.78' in contents and '0.51' in contents, "Flexi Cap figures were collapsed away"
+    assert {doc.metadata['scheme'] for doc in kept} == {'Large Cap', 'Flexi Cap'}, "a scheme lost its chunk"
+    assert removed == 1, f"the exact Large Cap copy should still collapse (removed {removed})"
+    print("✅ Template chunks with different figures are kept apart")
+    return True
+
+def _write_pdf_fixture(path, pages):
+    """Write a minimal uncompressed PDF with one line of text per page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] "
+               f"/Count {len(pages)} >>".encode(),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    body = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    body += f"trailer << /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(bytes(body))
+
+def test_pdf_extraction():
+    """Test page-by-page extraction of linked PDFs on a local fixture"""
+    print("\nTesting PDF extraction...")
+    import tempfile
+    from pdf_collector import PdfReader, iter_page_items
+    assert PdfReader is not None, "pypdf is not installed (pip install -r requirements.txt)"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "fixture.pdf"
+        _write_pdf_fixture(path, ["Exit load 1 percent", "", "Expense ratio 0.65 percent"])
+        link = {'url': 'https://example.com/kim.pdf', 'text': 'KIM', 'parent_url': '', 'parent_title': ''}
+        items = list(iter_page_items(path, link))
+    pages = [item['url'].rsplit('=', 1)[1] for item in items]
+    assert pages == ['1', '3'], f"expected pages 1 and 3 (empty page skipped), got {pages}"
+    assert 'Exit load 1 percent' in items[0]['content'], f"unexpected page 1 text: {items[0]['content']!r}"
+    assert 'Expense ratio 0.65 percent' in items[1]['content'], f"unexpected page 3 text: {items[1]['content']!r}"
+    assert all(item['document'] == link['url'] for item in items), "pages must keep the PDF URL as their document"
+    print("✅ PDF pages extracted (empty pages skipped)")
+    return True
+
 def main():
     print("=" * 60)
     print("Mutual Fund Facts Assistant - System Test")
@@ -108,6 +197,9 @@ def main():
     results.append(("Data Collection", test_data_collection()))
     results.append(("Vector Store", test_vector_store()))
     results.append(("RAG Pipeline", test_rag_pipeline()))
+    results.append(("Advice Routing", test_advice_routing()))
+    results.append(("PDF Extraction", test_pdf_extraction()))
+    results.append(("Deduplication", test_dedup_keeps_figures()))
     
     print("\n" + "=" * 60)
     print("Test Summary")
@@ -117,7 +209,8 @@ def main():
         status = "✅ PASS" if result else "⚠️  CHECK"
         print(f"{name:20} {status}")
     
-    critical = [name for name, result in results[:2] if not result]
+    critical_checks = ("Imports", "Environment", "Advice Routing", "PDF Extraction", "Deduplication")
+    critical = [name for name, result in results if name in critical_checks and not result]
     if critical:
         print(f"\n❌ Critical issues found: {', '.join(critical)}")
         print("Please fix these before running the application.")
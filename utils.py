@@ -1,8 +1,13 @@
 """
 Utility functions for the Mutual Fund Facts Assistant
 """
+import json
 import re
-from typing import List, Optional
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import config
+from query_router import get_router
 
 def clean_text(text: str) -> str:
     """Clean and normalize text content"""
@@ -14,18 +19,7 @@ def clean_text(text: str) -> str:
 
 def extract_scheme_name(query: str) -> Optional[str]:
     """Extract scheme name from query if mentioned"""
-    schemes = {
-        'large cap': 'Nippon India Large Cap Fund',
-        'flexi cap': 'Nippon India Flexi Cap Fund',
-        'elss': 'Nippon India ELSS Tax Saver Fund',
-        'small cap': 'Nippon India Small Cap Fund'
-    }
-    
-    query_lower = query.lower()
-    for key, value in schemes.items():
-        if key in query_lower:
-            return value
-    return None
+    return get_router().route(query)['scheme']
 
 def validate_url(url: str) -> bool:
     """Validate URL format"""
@@ -45,3 +39,32 @@ def format_source_url(url: str) -> str:
         url = url.split('?')[0]
     return url
 
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a question used as cache / catalog key
+
+    Kept in sync with normalizeQuery() in public/index.html and docs/index.html.
+    """
+    query = re.sub(r'[^a-z0-9\s]', ' ', query.lower())
+    return re.sub(r'\s+', ' ', query).strip()
+
+def write_index_version(directory: Path, version: str, chunks: int):
+    """Persist the index version next to the vector store"""
+    with open(Path(directory) / config.INDEX_VERSION_FILE, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': version,
+            'chunks': chunks,
+            'built_at': datetime.now().isoformat(timespec='seconds')
+        }, f)
+
+def read_index_info(directory: Path = config.VECTOR_STORE_DIR) -> Dict:
+    """Contents of the index version file in `directory` (empty if there is none)"""
+    try:
+        with open(Path(directory) / config.INDEX_VERSION_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def read_index_version(directory: Path = config.VECTOR_STORE_DIR) -> str:
+    """Version of the index in `directory`, or 'unversioned' for stores built before versioning"""
+    return read_index_info(directory).get('version', 'unversioned')
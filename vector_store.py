@@ -7,11 +7,20 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
+import hashlib
 import json
 import logging
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 import config
+from dedup import ChunkDeduplicator
+from embedding_cache import get_embedding_cache
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from query_router import partition_tags
+from shared_index import SharedEmbeddingIndex
+from utils import normalize_query, read_index_version, write_index_version
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,14 +28,19 @@ logger = logging.getLogger(__name__)
 class VectorStore:
     """Manages vector store for RAG system"""
     
-    def __init__(self):
+    def __init__(self, collection_name: str = config.COLLECTION_NAME,
+                 vector_store_path: Path = config.VECTOR_STORE_DIR):
         self.embeddings = OpenAIEmbeddings(model=config.EMBEDDING_MODEL)
+        self.chunk_size = config.CHUNK_SIZE
+        self.chunk_overlap = config.CHUNK_OVERLAP
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.CHUNK_SIZE,
-            chunk_overlap=config.CHUNK_OVERLAP,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
             length_function=len,
         )
-        self.vector_store_path = config.VECTOR_STORE_DIR
+        self.collection_name = collection_name
+        self.vector_store_path = Path(vector_store_path)
+        self.vector_store_path.mkdir(parents=True, exist_ok=True)
         
         # Initialize ChromaDB
         self.client = chromadb.PersistentClient(
@@ -35,31 +49,81 @@ class VectorStore:
         )
         
         self.vector_store = None
+        self.lexical_index = None
+        self.shared_index = None
+        self.lexical_index_path = self.vector_store_path / config.LEXICAL_INDEX_FILE
+        self.dedup_stats = None
+        # Chunks added with defer=True that the lexical index and exported vectors do not have yet
+        self._pending_ids: List[str] = []
+        self._pending_documents: List[Document] = []
         
-    def create_documents_from_data(self, data: List[Dict]) -> List[Document]:
-        """Convert scraped data to LangChain documents"""
-        documents = []
+    def _page_documents(self, item: Dict, chunks: List[Tuple[str, int]]) -> List[Document]:
+        """Documents for one page's chunks; start/end offsets index into page_text(item)"""
+        # Scheme / document-type tags define the partitions queries are routed to
+        tags = partition_tags(item.get('url', ''), item.get('title', ''), item.get('parent_url', ''))
+        if item.get('document'):
+            # Pages of a linked PDF share the PDF's URL, so the whole document can be replaced at once
+            tags['document'] = item['document']
         
-        for item in data:
-            # Create document with metadata
-            doc_content = f"Title: {item.get('title', '')}\n\n{item.get('content', '')}"
-            
-            # Split into chunks
-            chunks = self.text_splitter.split_text(doc_content)
-            
-            for i, chunk in enumerate(chunks):
-                doc = Document(
-                    page_content=chunk,
-                    metadata={
-                        'source': item.get('url', ''),
-                        'title': item.get('title', ''),
-                        'chunk_index': i,
-                        'total_chunks': len(chunks)
-                    }
+        return [
+            Document(
+                page_content=chunk,
+                metadata={
+                    'source': item.get('url', ''),
+                    'title': item.get('title', ''),
+                    'chunk_index': i,
+                    'total_chunks': len(chunks),
+                    'start_index': start,
+                    'end_index': start + len(chunk),
+                    **tags
+                }
+            )
+            for i, (chunk, start) in enumerate(chunks)
+        ]
+    
+    def iter_documents_from_data(self, data: Iterable[Dict],
+                                 workers: int = config.CHUNK_WORKERS) -> Iterator[Document]:
+        """Yield chunk documents page by page, splitting large pages in a process pool
+        
+        Pages are yielded in input order, so the output is identical to the serial path.
+        """
+        if workers <= 0:
+            for item in data:
+                yield from self._page_documents(
+                    item, offset_chunks(self.text_splitter, page_text(item), self.chunk_overlap)
                 )
-                documents.append(doc)
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for item in data:
+                text = page_text(item)
+                if len(text) >= config.CHUNK_PARALLEL_MIN_CHARS:
+                    chunks = pool.submit(split_page, text, self.chunk_size, self.chunk_overlap)
+                else:
+                    chunks = offset_chunks(self.text_splitter, text, self.chunk_overlap)
+                pending.append((item, chunks))
+                
+                # Emit finished pages in order, keeping a bounded number of pages in flight
+                while pending and (len(pending) > workers * 4 or not isinstance(pending[0][1], Future)
+                                   or pending[0][1].done()):
+                    item, chunks = pending.popleft()
+                    yield from self._page_documents(item, _result(chunks))
+            
+            while pending:
+                item, chunks = pending.popleft()
+                yield from self._page_documents(item, _result(chunks))
+    
+    def create_documents_from_data(self, data: List[Dict]) -> List[Document]:
+        """Convert scraped data to LangChain documents"""
+        documents = list(self.iter_documents_from_data(data))
         
         logger.info(f"Created {len(documents)} documents from {len(data)} sources")
+        
+        # Drop repeated boilerplate and near-duplicate chunks before they are embedded
+        if config.DEDUP_ENABLED and documents:
+            documents, self.dedup_stats = ChunkDeduplicator().deduplicate(documents)
+        
         return documents
     
     def build_vector_store(self, documents: List[Document], recreate: bool = False):
@@ -67,7 +131,7 @@ class VectorStore:
         if recreate:
             # Delete existing collection
             try:
-                self.client.delete_collection(name=config.COLLECTION_NAME)
+                self.client.delete_collection(name=self.collection_name)
             except:
                 pass
         
@@ -75,60 +139,350 @@ class VectorStore:
         self.vector_store = Chroma.from_documents(
             documents=documents,
             embedding=self.embeddings,
-            collection_name=config.COLLECTION_NAME,
+            collection_name=self.collection_name,
             persist_directory=str(self.vector_store_path),
             client=self.client
         )
         
+        # Lexical index over the exact same chunks, persisted alongside Chroma
+        self.lexical_index = BM25Index()
+        self.lexical_index.build(documents)
+        self.lexical_index.save(self.lexical_index_path)
+        
+        self.export_shared_index()
+        self._write_index_version()
+        
         logger.info(f"Vector store built with {len(documents)} documents")
     
+    def add_documents(self, documents: List[Document], defer: bool = False):
+        """Insert chunks into an existing store without rebuilding it
+        
+        With defer=True the chunks only go into Chroma; call flush_additions() once after the last
+        batch to update the lexical index, exported vectors and index version for all of them.
+        At most MAX_PENDING_CHUNKS chunks are held back, so memory does not grow with the document.
+        """
+        if not self.vector_store:
+            self.load_vector_store()
+        ids = self.vector_store.add_documents(documents)
+        self._pending_ids.extend(ids)
+        self._pending_documents.extend(documents)
+        logger.info(f"Added {len(documents)} documents to vector store")
+        if not defer or len(self._pending_ids) >= config.MAX_PENDING_CHUNKS:
+            self.flush_additions()
+
+    def flush_additions(self):
+        """Bring the lexical index, exported vectors and index version up to date with added chunks"""
+        if not self._pending_ids:
+            return
+        ids, documents = self._pending_ids, self._pending_documents
+        self._pending_ids, self._pending_documents = [], []
+
+        self.lexical_index.build(self.lexical_index.documents + documents)
+        self.lexical_index.save(self.lexical_index_path)
+
+        # Extend the exported vectors in place; a saved IVF index inserts them on next load
+        embeddings_path, _ = SharedEmbeddingIndex.paths(self.vector_store_path)
+        if embeddings_path.exists():
+            data = self.vector_store.get(ids=ids, include=['embeddings', 'documents', 'metadatas'])
+            added = [
+                Document(page_content=content, metadata=metadata or {})
+                for content, metadata in zip(data.get('documents') or [], data.get('metadatas') or [])
+            ]
+            SharedEmbeddingIndex.append(self.vector_store_path, data.get('embeddings'), added)
+            if self.shared_index is not None:
+                self.shared_index = SharedEmbeddingIndex.load(self.vector_store_path)
+
+        self._write_index_version()
+        logger.info(f"Indexed {len(ids)} added documents")
+
+    def replace_documents(self, urls: Iterable[str], documents: List[Document]):
+        """Make the stored chunks of the given source URLs exactly `documents`, re-embedding only
+        the chunks that changed (no full rebuild)
+        
+        `documents` must come from deduplicating the whole corpus (see refresh_sources): boilerplate
+        is only recognised across pages, and a collapsed chunk of one page stands for others too.
+        """
+        if not self.vector_store:
+            self.load_vector_store()
+        urls = set(urls)
+        
+        wanted = {_chunk_key(doc.page_content, doc.metadata): doc for doc in documents}
+        stale_ids = []
+        unchanged = set()
+        for url in urls:
+            stored = self.vector_store.get(where={'source': url}, include=['documents', 'metadatas'])
+            for chunk_id, content, metadata in zip(stored.get('ids') or [], stored.get('documents') or [],
+                                                   stored.get('metadatas') or []):
+                key = _chunk_key(content, metadata or {})
+                if key in wanted and key not in unchanged:
+                    unchanged.add(key)
+                else:
+                    stale_ids.append(chunk_id)
+        added = [doc for key, doc in wanted.items() if key not in unchanged]
+        if not stale_ids and not added:
+            logger.info(f"No chunk changed in {len(urls)} sources")
+            return
+        
+        if stale_ids:
+            self.vector_store.delete(ids=stale_ids)
+        if added:
+            self.vector_store.add_documents(added)
+        
+        kept = [doc for doc in self.lexical_index.documents if doc.metadata.get('source') not in urls]
+        self.lexical_index.build(kept + list(wanted.values()))
+        self.lexical_index.save(self.lexical_index_path)
+        
+        # Rows cannot be removed from the exported vectors in place, so re-export (no re-embedding)
+        embeddings_path, _ = SharedEmbeddingIndex.paths(self.vector_store_path)
+        if embeddings_path.exists():
+            self.export_shared_index()
+            if self.shared_index is not None:
+                self.shared_index = SharedEmbeddingIndex.load(self.vector_store_path)
+        
+        self._write_index_version()
+        logger.info(f"Replaced {len(stale_ids)} chunks with {len(added)} "
+                    f"({len(unchanged)} unchanged) in {len(urls)} sources")
+    
+    def _delete_where(self, field: str, values: Iterable[str]) -> int:
+        """Delete the Chroma chunks whose metadata `field` is one of `values`"""
+        stale_ids = []
+        for value in values:
+            stale_ids.extend(self.vector_store.get(where={field: value}).get('ids') or [])
+        if stale_ids:
+            self.vector_store.delete(ids=stale_ids)
+        return len(stale_ids)
+    
+    def remove_documents(self, values: Iterable[str], field: str = 'source'):
+        """Drop every chunk whose metadata `field` is one of `values` (e.g. all pages of one PDF)"""
+        if not self.vector_store:
+            self.load_vector_store()
+        values = set(values)
+        removed = self._delete_where(field, values)
+        if not removed:
+            return
+        
+        self.lexical_index.build([doc for doc in self.lexical_index.documents if doc.metadata.get(field) not in values])
+        self.lexical_index.save(self.lexical_index_path)
+        embeddings_path, _ = SharedEmbeddingIndex.paths(self.vector_store_path)
+        if embeddings_path.exists():
+            self.export_shared_index()
+            if self.shared_index is not None:
+                self.shared_index = SharedEmbeddingIndex.load(self.vector_store_path)
+        self._write_index_version()
+        logger.info(f"Removed {removed} chunks")
+    
+    def refresh_sources(self, all_data: List[Dict]):
+        """Re-index after some pages were re-scraped; `all_data` is the whole scraped corpus
+        
+        Chunking and deduplication run over every page, exactly as in a full build, so the
+        result is the same; only chunks that differ from the stored ones are embedded.
+        """
+        self.replace_documents([item.get('url', '') for item in all_data], self.create_documents_from_data(all_data))
+    
+    def _write_index_version(self):
+        """Record a content hash of the indexed chunks; it changes only when the index does"""
+        digest = hashlib.sha256()
+        for doc in self.lexical_index.documents:
+            digest.update(doc.metadata.get('source', '').encode('utf-8'))
+            digest.update(doc.page_content.encode('utf-8'))
+        write_index_version(self.vector_store_path, digest.hexdigest()[:16], len(self.lexical_index.documents))
+
+    @property
+    def index_version(self) -> str:
+        return read_index_version(self.vector_store_path)
+
     def load_vector_store(self):
         """Load existing vector store"""
         try:
             self.vector_store = Chroma(
-                collection_name=config.COLLECTION_NAME,
+                collection_name=self.collection_name,
                 embedding_function=self.embeddings,
                 persist_directory=str(self.vector_store_path),
                 client=self.client
             )
             # Quick check to ensure collection is not empty
-            _ = self.vector_store.get()
+            collection_data = self.vector_store.get()
             logger.info("Vector store loaded")
         except Exception as e:
             logger.warning(f"Vector store load failed: {e}")
             self.vector_store = None
             raise
+        
+        self._load_lexical_index(collection_data)
+    
+    def _load_lexical_index(self, collection_data: Dict):
+        """Load the persisted BM25 index, rebuilding it from Chroma if missing"""
+        try:
+            if self.lexical_index_path.exists():
+                self.lexical_index = BM25Index.load(self.lexical_index_path)
+                return
+        except Exception as e:
+            logger.warning(f"Lexical index load failed, rebuilding: {e}")
+        
+        documents = [
+            Document(page_content=content, metadata=metadata or {})
+            for content, metadata in zip(collection_data.get('documents') or [],
+                                         collection_data.get('metadatas') or [])
+        ]
+        self.lexical_index = BM25Index()
+        self.lexical_index.build(documents)
+        try:
+            self.lexical_index.save(self.lexical_index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist lexical index: {e}")
+    
+    def export_shared_index(self):
+        """Dump the collection's embeddings to a memory-mappable file for server workers"""
+        data = self.vector_store.get(include=['embeddings', 'documents', 'metadatas'])
+        documents = [
+            Document(page_content=content, metadata=metadata or {})
+            for content, metadata in zip(data.get('documents') or [], data.get('metadatas') or [])
+        ]
+        SharedEmbeddingIndex.export(self.vector_store_path, data.get('embeddings'), documents)
+    
+    def use_shared_index(self):
+        """Serve vector search from the read-only memory-mapped index instead of Chroma"""
+        if not self.vector_store:
+            self.load_vector_store()
+        embeddings_path, _ = SharedEmbeddingIndex.paths(self.vector_store_path)
+        if not embeddings_path.exists():
+            self.export_shared_index()
+        self.shared_index = SharedEmbeddingIndex.load(self.vector_store_path)
+    
+    @staticmethod
+    def _chroma_filter(filters: Optional[Dict]) -> Optional[Dict]:
+        """Translate a flat metadata dict into a Chroma where-clause"""
+        if not filters:
+            return None
+        if len(filters) == 1:
+            return dict(filters)
+        return {'$and': [{key: value} for key, value in filters.items()]}
+    
+    def lexical_search(self, query: str, k: int = config.TOP_K_RESULTS,
+                       filters: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """BM25 hits as (document, normalized score) pairs"""
+        if not self.vector_store:
+            self.load_vector_store()
+        return self.lexical_index.search(query, k=k, filters=filters) if self.lexical_index else []
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query once so it can be reused across searches (cached by normalized query)"""
+        # The normalized query is both the cache key and the embedded text, so a key always
+        # holds the same vector whichever phrasing (or warming) filled it
+        text = normalize_query(query)
+        cache = get_embedding_cache()
+        embedding = cache.get(text)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            cache.put(text, embedding)
+        return embedding
     
-    def search(self, query: str, k: int = config.TOP_K_RESULTS) -> List[Document]:
-        """Search vector store for relevant documents"""
+    def vector_search(self, query_embedding: List[float], k: int = config.TOP_K_RESULTS,
+                      filters: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Nearest chunks as (document, cosine similarity) pairs, best first"""
         if not self.vector_store:
             self.load_vector_store()
+        if self.shared_index is not None:
+            return self.shared_index.search(query_embedding, k=k, filters=filters)
         
-        results = self.vector_store.similarity_search_with_score(
-            query, k=k
+        results = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+            query_embedding, k=k, filter=self._chroma_filter(filters)
         )
-        
-        # Return documents (without scores for now)
-        return [doc for doc, score in results]
+        # Chroma returns squared L2 distance; on unit-length embeddings cos = 1 - d / 2
+        return [(doc, 1 - distance / 2) for doc, distance in results]
     
-    def search_with_sources(self, query: str, k: int = config.TOP_K_RESULTS) -> List[Dict]:
-        """Search and return results with source URLs"""
-        documents = self.search(query, k)
-        
-        results = []
-        seen_sources = set()
+    def search(self, query: str, k: int = config.TOP_K_RESULTS,
+               filters: Optional[Dict] = None, trace: Optional[Dict] = None) -> List[Document]:
+        """Search for relevant documents, lexically first and by vector when needed
         
-        for doc in documents:
-            source_url = doc.metadata.get('source', '')
-            if source_url and source_url not in seen_sources:
-                results.append({
-                    'content': doc.page_content,
-                    'source': source_url,
-                    'title': doc.metadata.get('title', '')
-                })
-                seen_sources.add(source_url)
+        `filters` restricts both searches to one metadata partition (e.g. a scheme).
+        If given, `trace['path']` is set to the path that answered ('lexical' or 'hybrid') and
+        `trace['score']` to its best match (normalized BM25 or cosine similarity).
+        """
+        # Decisive keyword hits (scheme names, KIM, SID, exit load...) skip the embedding call
+        lexical_results = self.lexical_search(query, k=k, filters=filters)
+        if BM25Index.is_decisive(lexical_results):
+            logger.debug(f"Lexical fast path for query: {query}")
+            if trace is not None:
+                trace['path'] = 'lexical'
+                trace['score'] = lexical_results[0][1]
+            return [doc for doc, score in lexical_results]
         
-        return results
+        if trace is not None:
+            trace['path'] = 'hybrid'
+        vector_results = self.vector_search(self.embed_query(query), k=k, filters=filters)
+        if trace is not None:
+            trace['score'] = vector_results[0][1] if vector_results else 0.0
+        return fuse_results(lexical_results, vector_results, k)
+    
+    def search_with_sources(self, query: str, k: int = config.TOP_K_RESULTS,
+                            filters: Optional[Dict] = None, trace: Optional[Dict] = None) -> List[Dict]:
+        """Search and return results with source URLs"""
+        return documents_to_sources(self.search(query, k, filters, trace))
+
+def _chunk_key(content: str, metadata: Dict) -> str:
+    """Identity of a stored chunk: its text and every metadata field"""
+    return hashlib.sha256(json.dumps([content, metadata], sort_keys=True).encode('utf-8')).hexdigest()
+
+def page_text(item: Dict) -> str:
+    """Text of a scraped page as it is chunked"""
+    return f"Title: {item.get('title', '')}\n\n{item.get('content', '')}"
+
+def offset_chunks(splitter: RecursiveCharacterTextSplitter, text: str,
+                  chunk_overlap: int = config.CHUNK_OVERLAP) -> List[Tuple[str, int]]:
+    """Split text into (chunk, start offset) pairs"""
+    chunks = []
+    index = 0
+    previous_len = 0
+    for chunk in splitter.split_text(text):
+        # Chunks overlap by at most chunk_overlap characters, so search from just before the previous end
+        start = text.find(chunk, max(0, index + previous_len - chunk_overlap))
+        index = start if start >= 0 else text.find(chunk)
+        previous_len = len(chunk)
+        chunks.append((chunk, index))
+    return chunks
+
+_splitters: Dict[Tuple[int, int], RecursiveCharacterTextSplitter] = {}
+
+def split_page(text: str, chunk_size: int, chunk_overlap: int) -> List[Tuple[str, int]]:
+    """offset_chunks() with a per-process splitter (runs in chunking pool workers)"""
+    key = (chunk_size, chunk_overlap)
+    if key not in _splitters:
+        _splitters[key] = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+    return offset_chunks(_splitters[key], text, chunk_overlap)
+
+def _result(chunks):
+    return chunks.result() if isinstance(chunks, Future) else chunks
+
+def fuse_results(lexical_results: List[Tuple[Document, float]],
+                 vector_results: List[Tuple[Document, float]], k: int) -> List[Document]:
+    """Hybrid ranking of lexical and vector hits (vector order alone if nothing matched lexically)"""
+    vector_docs = [doc for doc, score in vector_results]
+    if not lexical_results:
+        return vector_docs[:k]
+    fused = reciprocal_rank_fusion([vector_docs, [doc for doc, score in lexical_results]])
+    return fused[:k]
+
+def documents_to_sources(documents: List[Document]) -> List[Dict]:
+    """One result per source URL, in ranking order"""
+    results = []
+    seen_sources = set()
+    
+    for doc in documents:
+        source_url = doc.metadata.get('source', '')
+        if source_url and source_url not in seen_sources:
+            results.append({
+                'content': doc.page_content,
+                'source': source_url,
+                'title': doc.metadata.get('title', '')
+            })
+            seen_sources.add(source_url)
+    
+    return results
 
 if __name__ == "__main__":
     from data_collector import DataCollector
@@ -142,7 +496,15 @@ if __name__ == "__main__":
         data = collector.collect_all_sources()
     
     # Build vector store
-    vs = VectorStore()
+    if config.ENABLE_SHARDING:
+        from sharding import ShardedVectorStore
+        vs = ShardedVectorStore()
+    else:
+        vs = VectorStore()
     documents = vs.create_documents_from_data(data)
     vs.build_vector_store(documents, recreate=True)
+    
+    # A full rebuild drops the linked PDFs' chunks; re-index the downloaded copies
+    from pdf_collector import PDFCollector
+    PDFCollector().force_index(vs)
 